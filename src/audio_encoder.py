@@ -0,0 +1,156 @@
+import subprocess
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import tool_runner
+from pcm_io import SAMPLE_RATE, to_pcm16
+
+# Encoder settings, frame size (samples per packet at 48 kHz) and most channels of the supported codecs.
+# The bitrate grows with the channel count up to the codec's maximum.
+# `roll` is the number of packets encoded before and after each chunk and dropped
+# when concatenating, so the encoder state at a join comes from the real signal:
+# AC-3 only needs its overlap window (the joins are then bit-exact), Opus its
+# prediction, and ffmpeg's AAC rate control settles over seconds.
+AUDIO_CODECS = {
+    'ac3': {'encoder': 'ac3', 'channel_bitrate': 96, 'max_bitrate': 640, 'frame': 1536, 'max_channels': 6,
+            'roll': 4, 'options': []},
+    'eac3': {'encoder': 'eac3', 'channel_bitrate': 96, 'max_bitrate': 1536, 'frame': 1536, 'max_channels': 6,
+             'roll': 4, 'options': []},
+    'aac': {'encoder': 'aac', 'channel_bitrate': 96, 'max_bitrate': 768, 'frame': 1024, 'max_channels': 8,
+            'roll': 96, 'options': []},
+    'opus': {'encoder': 'libopus', 'channel_bitrate': 64, 'max_bitrate': 512, 'frame': 960, 'max_channels': 8,
+             'roll': 16, 'options': ['-frame_duration', '20']},
+}
+
+# Length of the chunks the final track is encoded in
+CHUNK_SECONDS = 30.0
+
+def encoder_args(codec: str, stream: str = 'a', channels: int = 2, layout: Optional[str] = None) -> List[str]:
+    """ffmpeg arguments that encode the given output audio stream with `codec`.
+
+    Raw PCM input only has a channel count, so a named multichannel layout
+    is put back on the stream (relabelled, not remixed).
+    """
+    settings = AUDIO_CODECS[codec]
+    bitrate = min(settings['channel_bitrate'] * channels, settings['max_bitrate'])
+    args = [f'-c:{stream}', settings['encoder'], f'-b:{stream}', f'{bitrate}k'] + settings['options']
+    if layout and channels > 2:
+        args.extend([f'-filter:{stream}', f'channelmap=channel_layout={layout}'])
+    return args
+
+def encoded_size(codec: str, channels: int, frames: int) -> int:
+    """Approximate size in bytes of `frames` samples encoded with `codec` (see encoder_args)"""
+    settings = AUDIO_CODECS[codec]
+    bitrate = min(settings['channel_bitrate'] * channels, settings['max_bitrate']) * 1000
+    return int(bitrate / 8 * frames / SAMPLE_RATE) + 64 * 1024
+
+def codec_for_channels(codec: str, channels: int) -> str:
+    """`codec`, or AAC if `codec` cannot carry that many channels"""
+    if channels <= AUDIO_CODECS[codec]['max_channels']:
+        return codec
+    for fallback in ('aac', 'opus'):
+        if channels <= AUDIO_CODECS[fallback]['max_channels']:
+            return fallback
+    raise ValueError(f"No supported codec can encode {channels} channels")
+
+def encode_blocks(blocks: Iterable[np.ndarray], output_path: Path, codec: str = 'ac3',
+                  channels: int = 2, layout: Optional[str] = None) -> None:
+    """Encode float32 PCM blocks into a Matroska audio file through ffmpeg's stdin"""
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', str(channels), '-i', 'pipe:0',
+        '-map', '0:a'
+    ] + encoder_args(codec, channels=channels, layout=layout) + ['-f', 'matroska', str(output_path)]
+    encoder = tool_runner.start(cmd, stdin=subprocess.PIPE)
+    try:
+        for block in blocks:
+            encoder.stdin.write(to_pcm16(block).tobytes())
+        encoder.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its return code tells why
+    except BaseException:
+        encoder.kill()
+        encoder.wait()
+        raise
+    encoder.wait(check=True)
+
+def plan_chunks(total_frames: int, codec: str, chunk_seconds: float = CHUNK_SECONDS) -> List[Tuple[int, int]]:
+    """Split [0, total_frames) into chunks of about `chunk_seconds` that start on packet boundaries.
+
+    Every chunk but the last lasts a whole number of packets and of
+    microseconds, so the concat list can state its duration exactly.
+    """
+    frame = AUDIO_CODECS[codec]['frame']
+    # Fewest packets that last a whole number of microseconds (3 for AAC's 1024 samples)
+    step = Fraction(frame * 1000000, SAMPLE_RATE).denominator
+    chunk_frames = max(1, round(chunk_seconds * SAMPLE_RATE / (frame * step))) * step * frame
+    return [(start, min(total_frames, start + chunk_frames)) for start in range(0, total_frames, chunk_frames)]
+
+def packet_times(path: Path) -> List[float]:
+    """Timestamps in seconds of the packets of the first audio stream, in file order"""
+    output = tool_runner.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'packet=pts_time', '-of', 'csv=p=0', str(path)
+    ], capture_output=True, text=True).stdout
+    return [float(line.split(',')[0]) for line in output.split()]
+
+def encode_chunk(samples: np.ndarray, encoded_path: Path, output_path: Path, codec: str, channels: int,
+                 layout: Optional[str], lead_frames: int, keep_frames: Optional[int]) -> None:
+    """Encode a chunk with its roll and keep the packets of [lead_frames, lead_frames + keep_frames).
+
+    `samples` start `lead_frames` (a whole number of packets) before the
+    chunk; keep_frames None keeps everything after the lead (the last chunk).
+    The cut packets are found by their timestamps in the encoded file, which
+    put each packet at the first input sample it codes, priming delay
+    included, and are dropped by index in a stream copy, so no packet is lost
+    or kept twice whatever the codec's delay or the container's rounding.
+    """
+    encode_blocks([samples], encoded_path, codec, channels, layout)
+    times = packet_times(encoded_path)
+    frame = AUDIO_CODECS[codec]['frame']
+
+    def packet_at(frames: int) -> int:
+        target = times[0] + frames / SAMPLE_RATE
+        index = min(range(len(times)), key=lambda i: abs(times[i] - target))
+        if abs(times[index] - target) > frame / SAMPLE_RATE / 4:
+            raise RuntimeError(f"{encoded_path} has no packet at {frames / SAMPLE_RATE:.6f}s "
+                               f"(nearest {times[index] - times[0]:.6f}s)")
+        return index
+
+    first = packet_at(lead_frames)
+    drop = f"lt(n\\,{first})"
+    if keep_frames is not None:
+        drop += f"+gte(n\\,{packet_at(lead_frames + keep_frames)})"
+    tool_runner.run([
+        'ffmpeg', '-y', '-v', 'error', '-copyts', '-i', str(encoded_path),
+        '-map', '0:a', '-c', 'copy', '-bsf:a', f"noise=drop={drop}",
+        '-f', 'matroska', str(output_path)
+    ])
+
+def concat_chunks(chunks: List[Tuple[Path, int]], list_path: Path, output_path: Path) -> None:
+    """Join trimmed chunks packet by packet (stream copy).
+
+    Each entry is (path, frames). The concat list states the exact duration
+    of every chunk, so the timestamps run on without gaps or overlaps, and
+    the output starts at the first chunk's first packet (the encoder delay),
+    like a single encode.
+    """
+    if not chunks:
+        raise ValueError("No chunks to join")
+    lines = ['ffconcat version 1.0']
+    for index, (path, frames) in enumerate(chunks):
+        escaped = str(path).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        if index < len(chunks) - 1:
+            lines.append(f"duration {frames / SAMPLE_RATE:.6f}")
+    list_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    start = packet_times(chunks[0][0])[0]
+    tool_runner.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-itsoffset', f"{start:.6f}", '-f', 'concat', '-safe', '0', '-i', str(list_path),
+        '-map', '0:a', '-c', 'copy',
+        str(output_path)
+    ])
@@ -1,255 +1,466 @@
 from pathlib import Path
 import subprocess
-from typing import List, Tuple
-import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import contextvars
+import multiprocessing
+import threading
 import time
-import os
-import hashlib
+import wave
+import numpy as np
+import tool_runner
+from audio_encoder import (AUDIO_CODECS, CHUNK_SECONDS, codec_for_channels, concat_chunks, encode_blocks,
+                           encode_chunk, encoded_size, plan_chunks)
+from pcm_io import SAMPLE_RATE, WavReader, channel_names, read_wav, wav_duration
+from progress import ProgressReporter
+from source_analysis import SourceAnalysis
+from tts_engine import SpeechClip
+from workspace import Workspace
+
+# Gain applied to the original audio while a voiceover is playing
+VOICEOVER_DUCK_GAIN = 0.8
+
+# Gains of the original under a cue (duck) and of the cue's voiceover, per treatment:
+# dialogue is dubbed over the ducked original; sung lyrics keep the song in front
+# with the translation underneath; over silence there is nothing to duck
+CUE_TREATMENTS = {
+    'dialogue': {'duck_gain': VOICEOVER_DUCK_GAIN, 'voice_gain': 1.0},
+    'lyrics': {'duck_gain': 1.0, 'voice_gain': 0.5},
+    'quiet': {'duck_gain': 1.0, 'voice_gain': 1.0},
+}
+
+def cue_treatment(is_lyrics: bool, source_label: Optional[str] = None) -> str:
+    """Treatment of a cue from its subtitle tags and what the source plays under it.
+
+    The analysis only moves a cue to the safe side: music confirms a cue
+    tagged as lyrics, speech makes it dialogue, and silence leaves the
+    original unducked. An untagged cue is always dialogue, because speech
+    over a score can look like music.
+    """
+    if source_label == 'silence':
+        return 'quiet'
+    if is_lyrics and source_label != 'speech':
+        return 'lyrics'
+    return 'dialogue'
+
+# Silence kept after the last voiceover when it runs past the source audio
+TAIL_SECONDS = 5.0
+
+# Chunk encoders running at once in this process, shared by all mixers (e.g. the jobs of the dubbing server)
+_encoder_slots = threading.BoundedSemaphore(multiprocessing.cpu_count())
+
+def _iter_windows(blocks: Iterable[np.ndarray], windows: List[Tuple[int, int]]) -> Iterator[np.ndarray]:
+    """Cut [start, end) windows, sorted by start and possibly overlapping, out of a stream of blocks.
+
+    Only the samples a later window still needs are held. Stops early if
+    the blocks run out before a window has any samples.
+    """
+    blocks = iter(blocks)
+    pieces: List[np.ndarray] = []
+    held_start = held_end = 0
+    for index, (start, end) in enumerate(windows):
+        while held_end < end:
+            block = next(blocks, None)
+            if block is None:
+                break
+            pieces.append(block)
+            held_end += len(block)
+        if not pieces:
+            return
+        held = np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+        yield held[start - held_start:end - held_start]
+        next_start = windows[index + 1][0] if index + 1 < len(windows) else held_end
+        pieces = [held[next_start - held_start:]]
+        held_start = next_start
 
 class AudioMixer:
-    def __init__(self):
-        # Create temp directory with a short path to avoid Windows path length limitations
-        temp_base = os.environ.get('TEMP', tempfile.gettempdir())
-        short_dir_name = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
-        self.temp_dir = Path(temp_base) / short_dir_name
-        self.temp_dir.mkdir(exist_ok=True)
-        
-        self.orig_audio = None
+    def __init__(self, workspace: Optional[Workspace] = None, codec: str = 'ac3',
+                 encode_workers: Optional[int] = None, dialogue_channel: Optional[str] = None,
+                 chunk_seconds: float = CHUNK_SECONDS):
+        self.workspace = workspace or Workspace()
+        self._owns_workspace = workspace is None
+
+        self.video_path = None
         self.final_audio = None
         self.mix_inputs = []  # Store all TTS segments and their timing
-        
-    def load_video_audio(self, video_path: Path) -> None:
-        """Extract full audio track from video once"""
-        print("Extracting audio from video...")
-        start_time = time.time()
-        
-        # Extract audio to temporary AAC file instead of WAV
-        self.orig_audio = self.temp_dir / "orig_audio.m4a"
-        cmd = [
-            'ffmpeg',
-            '-i', str(video_path),
-            '-vn',  # No video
-            '-c:a', 'aac',  # Use AAC codec
-            '-b:a', '192k',  # 192kbps bitrate
-            '-ar', '48000',  # Higher sample rate
-            '-ac', '2',  # Stereo
-            '-y',  # Overwrite if exists
-            '-strict', '-2',  # Add strict flag for experimental codecs
-            str(self.orig_audio)
+        # The mix keeps the channel layout of the source (see set_source)
+        self.channels = 2
+        self.channel_layout = None
+        # Channel that gets the voiceovers and the ducking: a name (FC, FL, ...), an index or 'all';
+        # by default the center channel if the source has one, otherwise all channels
+        self.dialogue_channel = dialogue_channel
+        self.dialogue_channels = slice(0, self.channels)
+        self.codec = codec
+        self.encode_workers = encode_workers or multiprocessing.cpu_count()
+        self.chunk_seconds = chunk_seconds
+
+    def mix_audio_segment(self, video_path: Path, tts_audio: Path,
+                          start_time: float, treatment: str = 'dialogue',
+                          duration: Optional[float] = None) -> float:
+        """Store TTS segment info for the block mixer"""
+        if video_path != self.video_path:
+            self.set_source(video_path)
+
+        # Conditioned clips carry their trimmed duration; probe anything else
+        if duration is None:
+            probe_cmd = [
+                'ffprobe',
+                '-v', 'error',
+                '-show_entries', 'format=duration',
+                '-of', 'default=noprint_wrappers=1:nokey=1',
+                str(tts_audio)
+            ]
+            duration = float(tool_runner.run(probe_cmd, capture_output=True, text=True).stdout.strip())
+
+        # Each clip is read by the mixer and released once the timeline has passed it
+        self.workspace.adopt(tts_audio)
+
+        # Store the mixing information for the block mixer
+        self.mix_inputs.append({
+            'file': tts_audio,
+            'start': start_time,
+            'duration': duration,
+            'treatment': treatment
+        })
+
+        return duration
+
+    def schedule_clips(self, clips: Iterable[SpeechClip], video_path: Path,
+                       on_clip: Optional[Callable[[], None]] = None,
+                       analysis: Optional[SourceAnalysis] = None) -> None:
+        """Place the clips on the timeline in order, each starting at its cue or after the previous clip.
+
+        With a source analysis each clip is treated by what the source plays
+        where it lands (see cue_treatment).
+        """
+        # The source is the timeline even without clips (a preview window with no cues, or all TTS calls failed)
+        self.set_source(video_path)
+        last_end_time = 0.0
+        for clip in clips:
+            actual_start = max(last_end_time, clip.start_time)
+            source_label = None
+            if analysis is not None:
+                source_label = analysis.label(actual_start, actual_start + (clip.duration or clip.end_time - clip.start_time))
+            tts_length_secs = self.mix_audio_segment(
+                video_path,
+                clip.path,
+                actual_start,
+                treatment=cue_treatment(clip.is_lyrics, source_label),
+                duration=clip.duration
+            )
+            last_end_time = actual_start + tts_length_secs
+            if on_clip is not None:
+                on_clip()
+
+    def set_source(self, video_path: Path) -> None:
+        """Use the first audio stream of `video_path` as the original and take over its channel layout"""
+        self.video_path = video_path
+        self.channels, self.channel_layout = self._probe_layout()
+        names = channel_names(self.channel_layout, self.channels)
+
+        choice = self.dialogue_channel
+        if choice is None:
+            choice = 'FC' if names and 'FC' in names and self.channels > 1 else 'all'
+        if choice == 'all':
+            self.dialogue_channels = slice(0, self.channels)
+        else:
+            if choice.isdigit():
+                index = int(choice)
+            elif names and choice.upper() in names:
+                index = names.index(choice.upper())
+            else:
+                raise ValueError(f"Dialogue channel {choice} is not in the source layout "
+                                 f"{self.channel_layout or self.channels} ({', '.join(names or [])})")
+            if index >= self.channels:
+                raise ValueError(f"Dialogue channel {index} is out of range for {self.channels} channels")
+            self.dialogue_channels = slice(index, index + 1)
+
+        codec = codec_for_channels(self.codec, self.channels)
+        if codec != self.codec:
+            print(f"Warning: {self.codec} cannot carry {self.channels} channels; encoding with {codec}")
+            self.codec = codec
+        target = ('all channels' if self.dialogue_channels.stop - self.dialogue_channels.start == self.channels
+                  else (names[self.dialogue_channels.start] if names else f"channel {self.dialogue_channels.start}"))
+        print(f"Source audio: {self.channel_layout or f'{self.channels} channels'}; voiceover mixed into {target}")
+
+    def _probe_layout(self) -> Tuple[int, Optional[str]]:
+        """Channel count and layout name of the source audio"""
+        if Path(self.video_path).suffix.lower() == '.wav':
+            try:
+                with wave.open(str(self.video_path), 'rb') as wav:
+                    channels = wav.getnchannels()
+                return channels, None
+            except (wave.Error, EOFError):
+                pass
+        probe_cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=channels,channel_layout',
+            '-of', 'default=noprint_wrappers=1',
+            str(self.video_path)
         ]
-        
         try:
-            subprocess.run(cmd, capture_output=True, check=True)
-            print(f"Audio extraction took {time.time() - start_time:.2f} seconds")
-        except subprocess.CalledProcessError as e:
-            print(f"Warning: Error extracting audio, falling back to simpler method: {e}")
-            # Try fallback method - explicitly target the second audio stream (usually AC3)
-            cmd = [
-                'ffmpeg',
-                '-i', str(video_path),
-                '-map', '0:a:1',  # Select second audio stream (usually AC3)
-                '-vn',  # No video
-                '-c:a', 'aac',  # Use AAC codec
-                '-b:a', '192k',  # 192kbps bitrate
-                '-ar', '48000',  # Higher sample rate
-                '-ac', '2',  # Stereo
-                '-y',  # Overwrite if exists
-                str(self.orig_audio)
-            ]
-            subprocess.run(cmd, capture_output=True, check=True)
-            print(f"Fallback audio extraction took {time.time() - start_time:.2f} seconds")
+            output = tool_runner.run(probe_cmd, capture_output=True, text=True).stdout
+            fields = dict(line.split('=', 1) for line in output.splitlines() if '=' in line)
+            layout = fields.get('channel_layout', '').strip()
+            return int(fields['channels']), layout if layout and layout != 'unknown' else None
+        except (subprocess.SubprocessError, KeyError, ValueError) as e:
+            print(f"Warning: Could not read the source channel layout, mixing in stereo: {e}")
+            return 2, 'stereo'
 
-    def mix_audio_segment(self, video_path: Path, tts_audio: Path,
-                          start_time: float, duck_level: float = 0.2, lyrics_mode: bool = False) -> float:
-        """Store TTS segment info for later batch processing"""
-        if self.orig_audio is None:
-            self.load_video_audio(video_path)
-        
-        # Get duration of TTS audio
+    def source_duration(self) -> float:
+        """Duration of the source audio in seconds"""
+        if self._source_is_mix_wav():
+            return wav_duration(self.video_path)
         probe_cmd = [
             'ffprobe',
             '-v', 'error',
+            '-select_streams', 'a:0',
             '-show_entries', 'format=duration',
             '-of', 'default=noprint_wrappers=1:nokey=1',
-            str(tts_audio)
+            str(self.video_path)
         ]
-        duration = float(subprocess.check_output(probe_cmd).decode().strip())
-        
-        # Check if TTS audio path is already short and accessible
-        short_path = tts_audio
-        if len(str(tts_audio)) > 240:
-            # Path is too long, need to copy to short name
-            short_name = f"tts_{len(self.mix_inputs)}.m4a"  # Use AAC instead of WAV
-            short_path = self.temp_dir / short_name
-            
-            # Copy file to temp location with short name, converting to AAC
-            print(f"Copying TTS audio to shorter path: {short_path}")
-            subprocess.run([
-                'ffmpeg', '-i', str(tts_audio),
-                '-c:a', 'aac',  # Use AAC codec
-                '-b:a', '192k',  # 192kbps bitrate
-                '-y',
-                str(short_path)
-            ], capture_output=True, check=True)
-        
-        # Store the mixing information for later - no longer care about lyrics_mode
-        self.mix_inputs.append({
-            'file': short_path,
-            'start': start_time,
-            'duration': duration
-        })
-        
-        return duration
+        try:
+            return float(tool_runner.run(probe_cmd, capture_output=True, text=True).stdout.strip())
+        except (subprocess.SubprocessError, ValueError) as e:
+            print(f"Warning: Could not read source duration: {e}")
+            return 0.0
+
+    def timeline_frames(self) -> int:
+        """Length of the final mix in samples: the source, or the last voiceover plus a short tail"""
+        voiceover_end = max([mix['start'] + mix['duration'] for mix in self.mix_inputs], default=0.0)
+        end = max(self.source_duration(), voiceover_end + TAIL_SECONDS if self.mix_inputs else 0.0)
+        return int(round(end * SAMPLE_RATE))
 
-    def save_final_audio(self) -> Path:
-        """Process audio in batches using compressed formats"""
+    def save_final_audio(self, progress: Optional[ProgressReporter] = None) -> Path:
+        """Mix the timeline in one pass and encode it in frame-aligned chunks in parallel.
+
+        The source is decoded once, in order. Each chunk's samples, with the
+        codec's roll on both sides, go to an ffmpeg encoder on a worker
+        thread, and the chunks are joined where their own packet timestamps
+        say the roll ends (see encode_chunk). With a single encode worker, or
+        a timeline of one chunk, the mix is piped into one encoder instead;
+        the roll and the join only cost time when nothing runs in parallel.
+        """
         print("Mixing final audio...")
         start_time = time.time()
-        
-        # Sort all segments by start time
-        sorted_inputs = sorted(self.mix_inputs, key=lambda x: x['start'])
-        
-        # Output path for final audio
-        output_path = self.temp_dir / "final_audio.ac3"
-        
-        # Create a temporary file for the processed voiceovers
-        voiceover_track = self.temp_dir / "voiceovers.m4a"
-        
-        # Get maximum duration
-        max_duration = max([mix['start'] + mix['duration'] for mix in self.mix_inputs]) + 5
-        
-        # Create silent base audio (using AAC)
-        silent_base = self.temp_dir / "silence.m4a"
-        if not silent_base.exists():
-            subprocess.run([
-                'ffmpeg', '-y',
-                '-f', 'lavfi',
-                '-i', f'anullsrc=r=48000:cl=stereo',
-                '-t', str(max_duration),
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                str(silent_base)
-            ], check=True)
-        
-        # First, create a track with just the voiceovers
-        print("Creating voiceover track...")
-        
-        # Process in batches to avoid command line length limitations
-        batch_size = 50
-        temp_segments = []
-        
-        total_batches = (len(sorted_inputs) + batch_size - 1) // batch_size
-        print(f"Processing {len(sorted_inputs)} segments in {total_batches} batches")
-        
-        for batch_idx in range(0, len(sorted_inputs), batch_size):
-            batch = sorted_inputs[batch_idx:batch_idx + batch_size]
-            batch_output = self.temp_dir / f"voiceover_batch_{batch_idx}.m4a"
-            
-            # Add all voiceovers to silent base
-            batch_cmd = ['ffmpeg', '-y', '-i', str(silent_base)]
-            
-            filter_parts = []
-            for i, mix in enumerate(batch):
-                batch_cmd.extend(['-i', str(mix['file'])])
-                # Place each voiceover at its timestamp at full volume
-                filter_parts.append(f"[{i+1}:a]adelay={int(mix['start']*1000)}|{int(mix['start']*1000)},volume=0dB[v{i}];")
-            
-            # Mix all voiceovers onto silent base
-            stream_refs = ''.join([f'[v{i}]' for i in range(len(batch))])
-            filter_parts.append(f"[0:a]{stream_refs}amix=inputs={len(batch)+1}:normalize=0[out]")
-            
-            batch_cmd.extend([
-                '-filter_complex', ''.join(filter_parts),
-                '-map', '[out]',
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                str(batch_output)
-            ])
-            
-            try:
-                subprocess.run(batch_cmd, check=True)
-                temp_segments.append(batch_output)
-            except subprocess.CalledProcessError as e:
-                print(f"Batch processing failed: {e}")
-                continue
-        
-        # Merge all temp segments into one track if needed
-        if len(temp_segments) == 1:
-            # Just use the single segment
-            voiceover_track = temp_segments[0]
-        elif len(temp_segments) > 1:
-            # Merge all segments
-            merge_cmd = ['ffmpeg', '-y']
-            for segment in temp_segments:
-                merge_cmd.extend(['-i', str(segment)])
-                
-            merge_cmd.extend([
-                '-filter_complex', f'amix=inputs={len(temp_segments)}:normalize=0[out]',
-                '-map', '[out]',
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                str(voiceover_track)
-            ])
-            
-            try:
-                subprocess.run(merge_cmd, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Merging segments failed: {e}")
-                # Use the first segment as fallback
-                if temp_segments:
-                    voiceover_track = temp_segments[0]
-        
-        # Now create the final audio by mixing original audio with 80% volume during voiceover
-        if os.path.exists(str(voiceover_track)):
-            print("Creating final audio by mixing original with volume-adjusted voiceovers...")
-            
-            # Create volume dip track for original audio - only reduce volume during voiceovers
-            final_cmd = [
-                'ffmpeg', '-y',
-                '-i', str(self.orig_audio),      # Original audio
-                '-i', str(voiceover_track),      # Voiceover track
-                '-filter_complex',
-                # Use the voiceover track to create a volume control track
-                '[1:a]volume=0,aeval=1*gt(val(0),0.001)[voiceover_map];' +
-                # Use that map to adjust original audio volume - 0.8 when voiceover is present, 1.0 otherwise
-                '[0:a][voiceover_map]volume=volume=0.8:eval=frame:enable=between(t,0,{duration})[lowered_orig];'.format(duration=max_duration) +
-                # Mix the lowered original with the voiceovers
-                '[lowered_orig][1:a]amix=inputs=2:normalize=0[out]',
-                '-map', '[out]',
-                '-c:a', 'ac3',
-                '-b:a', '192k',
-                str(output_path)
-            ]
-            
+
+        total_frames = self.timeline_frames()
+        if total_frames == 0:
+            # ffmpeg writes a broken file for empty input
+            raise ValueError(f"Nothing to encode: {self.video_path} has no audio and no voiceover was scheduled")
+        chunks = plan_chunks(total_frames, self.codec, self.chunk_seconds)
+        if progress is not None:
+            progress.set_total(total_frames / SAMPLE_RATE, 'seconds')
+        output_hint = encoded_size(self.codec, self.channels, total_frames)
+
+        if self.encode_workers == 1 or len(chunks) <= 1:
+            print(f"Encoding {total_frames / SAMPLE_RATE:.1f} seconds of {self.codec} audio in a single pass")
+            def tracked(blocks):
+                for block in blocks:
+                    if progress is not None:
+                        progress.advance(len(block) / SAMPLE_RATE, nbytes=len(block) * self.channels * 2)
+                    yield block
+            output_path = self.workspace.path("final_audio.mka", size_hint=output_hint)
+            encode_blocks(tracked(self.iter_mixed_blocks(0, total_frames)), output_path,
+                          self.codec, self.channels, self.channel_layout)
+            self.workspace.commit(output_path)
+            print(f"Final audio processing completed in {time.time() - start_time:.2f} seconds")
+            return output_path
+
+        print(f"Encoding {total_frames / SAMPLE_RATE:.1f} seconds of {self.codec} audio "
+              f"in {len(chunks)} chunks on {self.encode_workers} encoders")
+        roll = AUDIO_CODECS[self.codec]['roll'] * AUDIO_CODECS[self.codec]['frame']
+        windows = [(max(0, chunk_start - roll), min(total_frames, chunk_end + roll)) for chunk_start, chunk_end in chunks]
+
+        def encode(samples, encoded_path, chunk_path, lead_frames, keep_frames):
+            with _encoder_slots:
+                encode_chunk(samples, encoded_path, chunk_path, self.codec, self.channels, self.channel_layout,
+                             lead_frames, keep_frames)
+
+        def finish(future):
+            encoded_path, chunk_path, frames = futures.pop(future)
+            future.result()
+            self.workspace.release(encoded_path)
+            self.workspace.commit(chunk_path)
+            if progress is not None:
+                progress.advance(frames / SAMPLE_RATE, nbytes=frames * self.channels * 2)
+
+        chunk_files = []
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.encode_workers) as executor:
             try:
-                subprocess.run(final_cmd, check=True)
-                print(f"Final audio processing completed in {time.time() - start_time:.2f} seconds")
-                return output_path
-            except subprocess.CalledProcessError as e:
-                print(f"Final processing failed: {e}")
-                # Fall back to simpler method
-        
-        # Fallback - simple mix if the advanced method failed
-        print("Using simple mix as fallback...")
-        fallback_cmd = [
-            'ffmpeg', '-y',
-            '-i', str(self.orig_audio),
-            '-i', str(voiceover_track) if os.path.exists(str(voiceover_track)) else str(silent_base),
-            '-filter_complex', 'amix=inputs=2:normalize=0[out]',
-            '-map', '[out]',
-            '-c:a', 'ac3',
-            '-b:a', '192k',
-            str(output_path)
-        ]
-        
-        subprocess.run(fallback_cmd, check=True)
-        print(f"Fallback audio processing completed in {time.time() - start_time:.2f} seconds")
+                mixed = _iter_windows(self.iter_mixed_blocks(0, total_frames), windows)
+                for index, ((chunk_start, chunk_end), (render_start, render_end), samples) in enumerate(
+                        zip(chunks, windows, mixed)):
+                    size_hint = encoded_size(self.codec, self.channels, render_end - render_start)
+                    encoded_path = self.workspace.path(f"final_chunk_{index:04d}.enc.mka", size_hint=size_hint)
+                    chunk_path = self.workspace.path(f"final_chunk_{index:04d}.mka", size_hint=size_hint)
+                    keep_frames = chunk_end - chunk_start if index < len(chunks) - 1 else None
+                    future = executor.submit(contextvars.copy_context().run, encode, samples, encoded_path,
+                                             chunk_path, chunk_start - render_start, keep_frames)
+                    futures[future] = (encoded_path, chunk_path, chunk_end - chunk_start)
+                    chunk_files.append((chunk_path, chunk_end - chunk_start))
+                    # Only a few chunks of samples wait for an encoder, so memory stays constant
+                    while len(futures) > self.encode_workers:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finish(future)
+                while futures:
+                    finish(next(iter(futures)))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        output_path = self.workspace.path("final_audio.mka", size_hint=output_hint)
+        concat_list = self.workspace.path("final_chunks.txt")
+        concat_chunks(chunk_files, concat_list, output_path)
+        self.workspace.commit(output_path)
+        self.workspace.release(concat_list)
+        for chunk_path, _ in chunk_files:
+            self.workspace.release(chunk_path)
+
+        print(f"Final audio processing completed in {time.time() - start_time:.2f} seconds")
         return output_path
 
+    def _source_is_mix_wav(self) -> bool:
+        """Whether the source is already a 16-bit WAV in the mix format (rate and channels)"""
+        if self.video_path is None or Path(self.video_path).suffix.lower() != '.wav':
+            return False
+        try:
+            with wave.open(str(self.video_path), 'rb') as wav:
+                return (wav.getsampwidth() == 2 and wav.getframerate() == SAMPLE_RATE
+                        and wav.getnchannels() == self.channels)
+        except (wave.Error, EOFError):
+            return False
+
+    def _open_source_decoder(self, start_frame: int = 0, end_frame: Optional[int] = None):
+        """Start ffmpeg decoding (a window of) the source audio to raw PCM on stdout"""
+        if self._source_is_mix_wav():
+            # Already raw PCM in the mix format; no decoder process is needed
+            return WavReader(self.video_path, start_frame, end_frame)
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+        if start_frame > 0:
+            # Input seeking: only the requested window is read and decoded
+            cmd.extend(['-ss', f"{start_frame / SAMPLE_RATE:.6f}"])
+        if end_frame is not None:
+            cmd.extend(['-t', f"{(end_frame - start_frame) / SAMPLE_RATE:.6f}"])
+        cmd.extend([
+            '-i', str(self.video_path),
+            '-vn',
+            '-f', 's16le',
+            '-acodec', 'pcm_s16le',
+            '-map', '0:a:0',
+            '-ar', str(SAMPLE_RATE),
+            'pipe:1'
+        ])
+        return tool_runner.start(cmd, stdout=subprocess.PIPE)
+
+    def iter_mixed_blocks(self, start_frame: int = 0, end_frame: Optional[int] = None,
+                          block_seconds: float = 1.0, release_clips: bool = True) -> Iterator[np.ndarray]:
+        """Yield the final mix as float32 blocks of shape (frames, channels).
+
+        The source audio is streamed from the decoder and each block gets the
+        voiceovers that overlap it added, with the original ducked underneath.
+        Both only touch the dialogue channel(s); the other channels of the
+        source pass through unchanged.
+        With `end_frame` exactly end_frame - start_frame frames are produced,
+        padded with silence past the end of the source. Clips are loaded when
+        they first overlap a block and, with `release_clips`, released from
+        the workspace once the timeline has passed them.
+        """
+        block_frames = int(block_seconds * SAMPLE_RATE)
+        block_bytes = block_frames * self.channels * 2
+        dialogue = self.dialogue_channels
+        dialogue_width = dialogue.stop - dialogue.start
+        clips = sorted(self.mix_inputs, key=lambda x: x['start'])
+        next_clip = 0
+        active = []  # (start_frame, samples, file, treatment)
+        if end_frame is None:
+            end_frame = max([int(round((mix['start'] + mix['duration']) * SAMPLE_RATE)) for mix in clips], default=0)
+            pad_to_end = False
+        else:
+            pad_to_end = True
+
+        # Clips that end before the window are never loaded
+        while next_clip < len(clips) and int(round((clips[next_clip]['start'] + clips[next_clip]['duration']) * SAMPLE_RATE)) + 1 < start_frame:
+            next_clip += 1
+
+        decoder = self._open_source_decoder(start_frame, end_frame if pad_to_end else None)
+        source_done = False
+        position = start_frame
+        try:
+            while True:
+                data = b'' if source_done else decoder.stdout.read(block_bytes)
+                if not data and not source_done:
+                    source_done = True
+                    # A decoder that fails or times out part-way must not be padded with silence
+                    decoder.wait(check=True)
+                if data:
+                    frames = len(data) // (self.channels * 2)
+                    if pad_to_end:
+                        frames = min(frames, end_frame - position)
+                    orig = np.frombuffer(data[:frames * self.channels * 2], dtype='<i2').reshape(frames, self.channels)
+                    block = orig.astype(np.float32) / 32768.0
+                elif position < end_frame:
+                    # Voiceovers (or the requested window) may run past the end of the source audio
+                    frames = min(block_frames, end_frame - position)
+                    block = np.zeros((frames, self.channels), dtype=np.float32)
+                else:
+                    break
+                if frames == 0:
+                    break
+                block_end = position + frames
+
+                while next_clip < len(clips) and int(round(clips[next_clip]['start'] * SAMPLE_RATE)) < block_end:
+                    mix = clips[next_clip]
+                    samples, _ = read_wav(mix['file'])
+                    if samples.shape[1] != dialogue_width:
+                        # e.g. a stereo clip for the center channel; a mono clip is spread over all dialogue channels
+                        samples = np.mean(samples, axis=1, keepdims=True)
+                    active.append((int(round(mix['start'] * SAMPLE_RATE)), samples, mix['file'],
+                                   CUE_TREATMENTS[mix.get('treatment', 'dialogue')]))
+                    next_clip += 1
+
+                duck = None
+                voice = np.zeros((frames, dialogue_width), dtype=np.float32)
+                for clip_start, samples, _, treatment in active:
+                    lo = max(position, clip_start)
+                    hi = min(block_end, clip_start + len(samples))
+                    if lo >= hi:
+                        continue
+                    clip_samples = samples[lo - clip_start:hi - clip_start]
+                    if treatment['voice_gain'] != 1.0:
+                        clip_samples = clip_samples * treatment['voice_gain']
+                    voice[lo - position:hi - position] += clip_samples
+                    if treatment['duck_gain'] != 1.0:
+                        if duck is None:
+                            duck = np.ones(frames, dtype=np.float32)
+                        # Where cues overlap, the original is ducked as far as the deepest one asks
+                        np.minimum(duck[lo - position:hi - position], treatment['duck_gain'],
+                                   out=duck[lo - position:hi - position])
+
+                if duck is not None:
+                    block[:, dialogue] *= duck[:, np.newaxis]
+                block[:, dialogue] += voice
+                yield block
+
+                still_active = []
+                for clip in active:
+                    if clip[0] + len(clip[1]) > block_end:
+                        still_active.append(clip)
+                    elif release_clips:
+                        self.workspace.release(clip[2])
+                active = still_active
+                position = block_end
+        finally:
+            if decoder.poll() is None:
+                decoder.kill()
+            decoder.wait()
+
     def cleanup(self):
         """Clean up temporary files"""
-        import shutil
-        try:
-            shutil.rmtree(self.temp_dir)
-        except Exception as e:
-            print(f"Warning: Could not clean up temp dir {self.temp_dir}: {e}") 
\ No newline at end of file
+        if self._owns_workspace:
+            self.workspace.cleanup()
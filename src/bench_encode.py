@@ -0,0 +1,79 @@
+import argparse
+import multiprocessing
+import time
+from pathlib import Path
+
+from audio_encoder import AUDIO_CODECS, encode_blocks
+from audio_mixer import AudioMixer
+import tool_runner
+from workspace import Workspace
+
+def make_source(path: Path, seconds: float) -> None:
+    """Generate a stereo test programme (tones over noise) of the given length"""
+    tool_runner.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+        '-f', 'lavfi', '-i', f'anoisesrc=color=pink:amplitude=0.1:sample_rate=48000:duration={seconds}',
+        '-filter_complex', '[0:a][1:a]amix=inputs=2,aformat=channel_layouts=stereo[out]',
+        '-map', '[out]', '-c:a', 'aac', '-b:a', '192k',
+        str(path)
+    ])
+
+def measure(encode) -> tuple:
+    """Run encode() and return (its output, wall seconds, CPU seconds of this process and its tools)"""
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    with tool_runner.track_usage() as usage:
+        output = encode()
+    cpu_seconds = time.process_time() - start_cpu + sum(record.cpu_seconds or 0.0 for record in usage)
+    return output, time.perf_counter() - start_wall, cpu_seconds
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description='Compare single-pass and chunked parallel final encodes')
+    parser.add_argument('--source', help='Audio or video file to encode (default: a generated 2-hour programme)')
+    parser.add_argument('--hours', type=float, default=2.0, help='Length of the generated programme (default: %(default)s)')
+    parser.add_argument('--codecs', nargs='+', default=sorted(AUDIO_CODECS), choices=sorted(AUDIO_CODECS))
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({2, max(2, cores)}),
+                        help='Chunk encoder counts to measure, each at least 2 (default: %(default)s)')
+    args = parser.parse_args()
+    if min(args.workers) < 2:
+        parser.error('--workers must be at least 2; one worker is the single pass')
+
+    print(f"Cores available: {cores}")
+    if cores == 1:
+        print("Note: with one core the chunk encoders cannot run in parallel; "
+              "the chunked times only show their overhead")
+
+    workspace = Workspace(prefer_memory=False)
+    try:
+        if args.source:
+            source = Path(args.source)
+        else:
+            source = workspace.path('bench_source.m4a')
+            print(f"Generating {args.hours:g} hour test source...")
+            make_source(source, args.hours * 3600)
+
+        for codec in args.codecs:
+            mixer = AudioMixer(workspace, codec=codec)
+            mixer.set_source(source)
+            total_frames = mixer.timeline_frames()
+            single_path = workspace.path(f'bench_single_{codec}.mka')
+            _, single_wall, single_cpu = measure(lambda: encode_blocks(
+                mixer.iter_mixed_blocks(0, total_frames), single_path, mixer.codec, mixer.channels,
+                mixer.channel_layout))
+            workspace.release(single_path)
+            print(f"{codec}: single pass {single_wall:.1f}s wall, {single_cpu:.1f}s CPU")
+
+            for workers in args.workers:
+                mixer.encode_workers = workers
+                chunked_path, wall, cpu = measure(mixer.save_final_audio)
+                workspace.release(chunked_path)
+                # CPU per wall second is how many cores the chunked encode really kept busy
+                print(f"{codec}: {workers} chunk encoders {wall:.1f}s wall, {cpu:.1f}s CPU, "
+                      f"{cpu / wall:.1f} cores busy, speedup {single_wall / wall:.2f}x")
+    finally:
+        workspace.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from pcm_io import read_wav, write_wav
+from workspace import Workspace
+
+# ITU-R BS.1770 K-weighting at 48 kHz: high shelf followed by a high pass
+_K_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285],
+            [1.0, -1.69065929318241, 0.73248077421585])
+_K_HIGHPASS = ([1.0, -2.0, 1.0],
+               [1.0, -1.99004745483398, 0.99007225036621])
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+@dataclass
+class ConditioningResult:
+    # The clip is placed at its cue start, so the speech starts on the cue
+    # whatever silence was trimmed before it
+    duration: float  # seconds of audio left after trimming
+
+def _biquad_response(coefficients, frequencies: np.ndarray, sample_rate: int) -> np.ndarray:
+    b, a = coefficients
+    z = np.exp(-2j * np.pi * frequencies / sample_rate)
+    return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+def gated_loudness(samples: np.ndarray, sample_rate: int) -> float:
+    """Integrated loudness in LUFS with BS.1770 K-weighting and gating.
+
+    The K-weighting filters are applied in the frequency domain over the whole
+    clip, which is exact enough for short TTS clips and needs no Python loop.
+    """
+    if len(samples) == 0:
+        return ABSOLUTE_GATE_LUFS
+    # Pad so the filters' decay does not wrap around the circular convolution
+    size = len(samples) + sample_rate // 10
+    spectrum = np.fft.rfft(samples, n=size, axis=0)
+    frequencies = np.fft.rfftfreq(size, 1.0 / sample_rate)
+    # The filter coefficients are defined at 48 kHz
+    response = (_biquad_response(_K_SHELF, frequencies, 48000) *
+                _biquad_response(_K_HIGHPASS, frequencies, 48000))
+    weighted = np.fft.irfft(spectrum * response[:, np.newaxis], n=size, axis=0)[:len(samples)]
+
+    # Mean square of 400 ms blocks with 75% overlap, summed over channels
+    block = int(0.4 * sample_rate)
+    hop = block // 4
+    energy = np.concatenate([np.zeros(1), np.cumsum(np.sum(weighted * weighted, axis=1))])
+    if len(samples) <= block:
+        powers = np.array([energy[-1] / len(samples)])
+    else:
+        starts = np.arange(0, len(samples) - block + 1, hop)
+        powers = (energy[starts + block] - energy[starts]) / block
+
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(powers)
+    gated = powers[block_loudness > ABSOLUTE_GATE_LUFS]
+    if len(gated) == 0:
+        return ABSOLUTE_GATE_LUFS
+    relative_gate = -0.691 + 10 * np.log10(np.mean(gated)) + RELATIVE_GATE_LU
+    gated = powers[(block_loudness > ABSOLUTE_GATE_LUFS) & (block_loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(np.mean(gated)))
+
+def speech_bounds(samples: np.ndarray, sample_rate: int, threshold_db: float,
+                  frame_seconds: float = 0.01, padding: float = 0.02) -> Tuple[int, int]:
+    """Return the (start, end) sample range between leading and trailing silence"""
+    frame = max(1, int(frame_seconds * sample_rate))
+    frames = len(samples) // frame
+    if frames == 0:
+        return 0, len(samples)
+    # RMS of the loudest channel per frame
+    framed = samples[:frames * frame].reshape(frames, frame, -1)
+    rms = np.sqrt(np.mean(framed * framed, axis=1)).max(axis=1)
+    loud = np.flatnonzero(rms > 10 ** (threshold_db / 20))
+    if len(loud) == 0:
+        return 0, len(samples)
+    pad = int(padding * sample_rate)
+    start = max(0, int(loud[0]) * frame - pad)
+    end = min(len(samples), (int(loud[-1]) + 1) * frame + pad)
+    return start, end
+
+class ClipConditioner:
+    """Trims silence from TTS clips and normalizes their loudness before mixing"""
+
+    def __init__(self, target_loudness: float = -18.0, silence_threshold_db: float = -50.0,
+                 peak_limit_db: float = -1.0, max_gain_db: float = 12.0):
+        self.target_loudness = target_loudness
+        self.silence_threshold_db = silence_threshold_db
+        self.peak_limit_db = peak_limit_db
+        self.max_gain_db = max_gain_db
+
+    def condition_samples(self, samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, ConditioningResult]:
+        start, end = speech_bounds(samples, sample_rate, self.silence_threshold_db)
+        trimmed = samples[start:end]
+
+        loudness = gated_loudness(trimmed, sample_rate)
+        gain_db = 0.0
+        if loudness > ABSOLUTE_GATE_LUFS:
+            gain_db = float(np.clip(self.target_loudness - loudness, -self.max_gain_db, self.max_gain_db))
+            # Never push peaks above the limit
+            peak = float(np.max(np.abs(trimmed))) if len(trimmed) else 0.0
+            if peak > 0:
+                gain_db = float(min(gain_db, self.peak_limit_db - 20 * np.log10(peak)))
+        conditioned = trimmed * np.float32(10 ** (gain_db / 20))
+
+        return conditioned, ConditioningResult(duration=len(trimmed) / sample_rate)
+
+    def condition(self, clip_path: Path, workspace: Optional[Workspace] = None) -> Tuple[Path, ConditioningResult]:
+        """Condition a WAV clip and return the path of the conditioned copy.
+
+        The conditioned clip is written into the workspace (or next to the
+        input when there is none); a workspace-owned input is released.
+        """
+        samples, sample_rate = read_wav(clip_path)
+        conditioned, result = self.condition_samples(samples, sample_rate)
+        # Unique per call: cached clips are shared by every cue with the same text,
+        # and each conditioned copy has its own consumer
+        name = f"{Path(clip_path).stem}.{uuid.uuid4().hex[:12]}.cond.wav"
+        output_path = (workspace.path(name, size_hint=conditioned.size * 2) if workspace is not None
+                       else Path(clip_path).with_name(name))
+        write_wav(output_path, conditioned, sample_rate)
+        if workspace is not None:
+            workspace.commit(output_path)
+            workspace.release(clip_path)
+        return output_path, result
@@ -0,0 +1,314 @@
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from audio_encoder import AUDIO_CODECS
+from main import AIDubber, normalize_ranges
+from progress import JsonLinesSink, ProgressReporter
+from tts_transport import DEFAULT_POOL_SIZE
+from workspace import DEFAULT_MEMORY_BUDGET
+
+@dataclass
+class DubJob:
+    video_path: str
+    subtitle_path: str
+    output_path: str
+    language: str = 'et'
+    output_mode: str = 'sidecar'  # or 'remux'
+    priority: int = 0  # lower runs first
+    preview_ranges: Optional[List[List[float]]] = None  # [[start, end], ...] seconds; a preview clip of these
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = 'queued'  # queued, running, done, failed, cancelled
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stage_metrics: Dict[str, float] = field(default_factory=dict)
+    tool_metrics: Dict[str, dict] = field(default_factory=dict)  # per stage and tool
+    progress: Optional[dict] = None  # last progress event of the running job
+
+class DubServer:
+    """Runs dubbing jobs from a priority queue with warm, long-lived resources.
+
+    The worker process pool (and the pooled TTS connections inside it), the
+    tool checks and the clip cache survive between jobs; each job is an
+    AIDubber.process_file call with its own workspace.
+    """
+
+    def __init__(self, workers: int = 1, clip_cache_dir: Optional[str] = None,
+                 clip_cache_limit: int = 2 * 1024 * 1024 * 1024,
+                 progress_sink: Optional[Callable[[dict], None]] = None, **dubber_options):
+        self.workers = workers
+        self.clip_cache_dir = clip_cache_dir
+        self.clip_cache_limit = clip_cache_limit
+        self.dubber_options = dubber_options
+        # Receives the progress events of every job (e.g. a JsonLinesSink)
+        self.progress_sink = progress_sink
+        self.executor = ProcessPoolExecutor(max_workers=multiprocessing.cpu_count())
+        self.jobs: Dict[str, DubJob] = {}
+        self.stage_totals: Dict[str, float] = {}
+        self.tool_totals: Dict[str, dict] = {}
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"dub-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put((float('inf'), next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+        self.executor.shutdown()
+
+    def submit(self, job: DubJob) -> DubJob:
+        with self._lock:
+            self.jobs[job.id] = job
+        self._queue.put((job.priority, next(self._sequence), job.id))
+        print(f"Queued job {job.id} (priority {job.priority}): {job.video_path}")
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != 'queued':
+                return False
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                break
+            with self._lock:
+                job = self.jobs[job_id]
+                if job.status != 'queued':
+                    continue
+                job.status = 'running'
+                job.started_at = time.time()
+            self._run(job)
+
+    def _run(self, job: DubJob):
+        dubber = None
+        def track(event: dict):
+            job.progress = event
+        callbacks = [track] + ([self.progress_sink] if self.progress_sink else [])
+        try:
+            dubber = AIDubber(language=job.language, executor=self.executor,
+                              clip_cache_dir=self.clip_cache_dir, output_mode=job.output_mode,
+                              preview_ranges=[tuple(window) for window in job.preview_ranges or []],
+                              progress=ProgressReporter(callbacks, job_id=job.id),
+                              **self.dubber_options)
+            dubber.process_file(job.video_path, job.subtitle_path, job.output_path)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            if dubber is not None:
+                job.stage_metrics = dict(dubber.stage_metrics)
+                job.tool_metrics = dubber.tool_metrics()
+                with self._lock:
+                    for stage, seconds in job.stage_metrics.items():
+                        self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + seconds
+                    for stage, tools in job.tool_metrics.items():
+                        for tool, summary in tools.items():
+                            totals = self.tool_totals.setdefault(stage, {}).setdefault(tool, dict.fromkeys(summary, 0))
+                            for key, value in summary.items():
+                                totals[key] = max(totals[key], value) if key == 'max_rss_bytes' else totals[key] + value
+            if self.clip_cache_dir:
+                prune_clip_cache(Path(self.clip_cache_dir), self.clip_cache_limit)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'jobs': counts,
+                'queue_depth': self._queue.qsize(),
+                'stage_seconds': dict(self.stage_totals),
+                'tools': {stage: {tool: dict(summary) for tool, summary in tools.items()}
+                          for stage, tools in self.tool_totals.items()}
+            }
+
+def prune_clip_cache(cache_dir: Path, max_bytes: int):
+    """Delete the least recently used clips until the cache fits into max_bytes"""
+    clips = []
+    for path in cache_dir.glob('*.wav'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        clips.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in clips)
+    for _, size, path in sorted(clips):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def make_handler(server: DubServer):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = [part for part in self.path.split('/') if part]
+            if parts == ['jobs']:
+                with server._lock:
+                    self._send_json(200, [asdict(job) for job in server.jobs.values()])
+            elif len(parts) == 2 and parts[0] == 'jobs':
+                job = server.jobs.get(parts[1])
+                if job is None:
+                    self._send_json(404, {'error': f"Unknown job {parts[1]}"})
+                else:
+                    self._send_json(200, asdict(job))
+            elif parts == ['metrics']:
+                self._send_json(200, server.metrics())
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            parts = [part for part in self.path.split('/') if part]
+            if parts == ['jobs']:
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                    job = DubJob(
+                        video_path=request['video_path'],
+                        subtitle_path=request['subtitle_path'],
+                        output_path=request['output_path'],
+                        language=request.get('language', 'et'),
+                        output_mode=request.get('output_mode', 'sidecar'),
+                        priority=int(request.get('priority', 0)),
+                        preview_ranges=[[float(start), float(end)] for start, end in request.get('preview_ranges') or []] or None
+                    )
+                    if job.preview_ranges:
+                        normalize_ranges(job.preview_ranges)  # rejects ranges that end before they start
+                    if job.output_mode not in ('sidecar', 'remux'):
+                        raise ValueError(f"output_mode must be 'sidecar' or 'remux', not {job.output_mode!r}")
+                except (KeyError, ValueError, TypeError) as e:
+                    self._send_json(400, {'error': f"Invalid job request: {e}"})
+                    return
+                server.submit(job)
+                self._send_json(202, asdict(job))
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                if server.cancel(parts[1]):
+                    self._send_json(200, asdict(server.jobs[parts[1]]))
+                else:
+                    self._send_json(409, {'error': f"Job {parts[1]} cannot be cancelled"})
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='AI Video Dubbing server')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8750, help='Port to listen on (default: %(default)s)')
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=1, help='Jobs processed at the same time (default: %(default)s)')
+    parser.add_argument('--clip-cache', help='Directory for TTS clips reused across jobs')
+    parser.add_argument('--clip-cache-limit', type=int, default=2048, help='Clip cache size in megabytes (default: %(default)s)')
+    parser.add_argument('--no-shm', action='store_true', help='Keep intermediates on disk instead of /dev/shm')
+    parser.add_argument('--shm-budget', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help='Megabytes of intermediates to keep in /dev/shm per job (default: %(default)s)')
+    parser.add_argument('--tts-endpoint', help='Send gTTS requests to this base URL instead of Google')
+    parser.add_argument('--tts-pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='Keep-alive connections per worker process (default: %(default)s)')
+    parser.add_argument('--progress-socket',
+                        help='Write the progress events of all jobs as JSON lines to this Unix socket path or host:port')
+    parser.add_argument('--codec', choices=sorted(AUDIO_CODECS), default='ac3',
+                        help='Codec of the dubbed audio tracks (default: %(default)s)')
+    parser.add_argument('--dialogue-channel',
+                        help="Channel that gets the voiceover and the ducking (e.g. FC, FL, an index or 'all'; default: center if present)")
+    parser.add_argument('--no-source-analysis', action='store_true',
+                        help='Treat cues by their subtitle tags only, without analyzing the original audio')
+    args = parser.parse_args()
+
+    server = DubServer(
+        workers=args.workers,
+        clip_cache_dir=args.clip_cache,
+        clip_cache_limit=args.clip_cache_limit * 1024 * 1024,
+        prefer_memory=not args.no_shm,
+        memory_budget=args.shm_budget * 1024 * 1024,
+        tts_endpoint=args.tts_endpoint,
+        tts_pool_size=args.tts_pool_size,
+        codec=args.codec,
+        analyze_source=not args.no_source_analysis,
+        dialogue_channel=args.dialogue_channel,
+        progress_sink=JsonLinesSink(address=args.progress_socket) if args.progress_socket else None
+    )
+    handler = make_handler(server)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        httpd = UnixHTTPServer(args.socket, handler)
+        print(f"Dubbing server listening on unix socket {args.socket}")
+    else:
+        httpd = ThreadingHTTPServer((args.host, args.port), handler)
+        print(f"Dubbing server listening on http://{args.host}:{args.port}")
+
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    server.start()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
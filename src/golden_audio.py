@@ -0,0 +1,481 @@
+"""Golden-audio regression check for the synthesis and mixing pipeline.
+
+Renders generated fixtures (a tone programme and a short SRT) through clip
+conditioning, clip scheduling and the block mixer. A deterministic offline
+speech stand-in takes the place of gTTS. The result is compared with the
+golden PCM in golden/:
+
+  - cue onsets: the lag of each voiceover onset, found by cross-correlation
+    of a voice-only render with golden/voice.wav, must be within
+    --onset-tolerance samples
+  - RMS level over each voiced (ducked) region within --rms-tolerance dB
+  - no clipped samples
+  - the largest sample-wise difference within --sample-tolerance LSB
+
+A 5.1 version of the source is mixed too: the voiceovers must land in the
+center channel only, and the other five channels must come out
+bit-identical to the source in 16-bit PCM.
+
+The source analysis is checked on labelled fixtures (speech, speech over
+a music bed, music, staccato piano, silence): every interval must get the
+expected label, and the cue treatments that follow from the labels must
+keep untagged cues as dialogue.
+
+When ffmpeg is available the mix is also encoded with every codec, in
+chunks of GOLDEN_CHUNK_SECONDS so the joins fall inside the cues, decoded
+and checked again with looser, codec-appropriate tolerances. The chunked
+track must also match a single-pass encode of the same mix: the same
+length and, around every join, the same samples (bit-identical for AC-3
+and E-AC-3, within JOIN_SNR_DB for AAC and Opus).
+
+    python src/golden_audio.py            # exit code 1 on a regression
+    python src/golden_audio.py --update   # accept the current output as golden
+"""
+import argparse
+import hashlib
+import json
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_encoder import AUDIO_CODECS, encode_blocks, plan_chunks
+from audio_mixer import AudioMixer, cue_treatment
+from clip_conditioner import ClipConditioner
+from main import SPEECH_SPEED
+from pcm_io import SAMPLE_RATE, channel_names, read_wav, to_pcm16, write_wav
+from source_analysis import LABELS, SourceAnalyzer
+from subtitle_processor import SubtitleEntry, SubtitleProcessor
+from tts_engine import SpeechClip, synthesize_cue
+import tool_runner
+from workspace import Workspace
+
+GOLDEN_DIR = Path(__file__).resolve().parent.parent / 'golden'
+
+FIXTURE_SECONDS = 5.0
+# (start, end, text); the second cue overlaps the first, so it is scheduled after it
+FIXTURE_CUES = [
+    (0.50, 1.60, "Tere hommikust, kuidas läheb?"),
+    (1.40, 2.60, "Hästi, aitäh!"),
+    (3.00, 4.20, "<i>La la laa, la la laa</i>"),
+]
+
+# Chunk length of the encoded renders; the fixture spans several chunks
+GOLDEN_CHUNK_SECONDS = 1.0
+
+# Codecs whose chunked encode decodes bit-identical to a single pass, and the
+# least SNR (dB) of the chunked against the single-pass track around a join for the others;
+# where the mix is silent the difference must stay below JOIN_SILENCE_DB
+EXACT_JOIN_CODECS = ('ac3', 'eac3')
+JOIN_SNR_DB = {'aac': 20.0, 'opus': 20.0}
+JOIN_SILENCE_DB = -90.0
+JOIN_WINDOW = SAMPLE_RATE // 50
+
+# Tone of each channel of the 5.1 fixture (FL, FR, FC, LFE, BL, BR), and the least level (dB)
+# the voiceover must add to the center channel over each cue
+MULTICHANNEL_TONES = (220, 330, 165, 55, 440, 550)
+MULTICHANNEL_VOICE_DB = -40.0
+
+# Length of each labelled fixture of the source analysis, and the treatments
+# (untagged cue, cue tagged as lyrics) that follow from each label
+ANALYSIS_SEGMENT_SECONDS = 6
+ANALYSIS_TREATMENTS = {
+    'speech': ('dialogue', 'dialogue'),
+    'music': ('dialogue', 'lyrics'),
+    'silence': ('quiet', 'quiet'),
+}
+
+# Window around each onset that is compared, and how far the onset may be searched
+ONSET_WINDOW = SAMPLE_RATE // 10
+ONSET_SEARCH = SAMPLE_RATE // 20
+
+class StandInSpeechEngine:
+    """Deterministic offline replacement for TTSEngine.
+
+    Each text gets a harmonic 'voice' with a pitch and level derived from its
+    hash, a syllable-rate envelope and some silence on both sides, so the
+    conditioning stage has something to trim and normalize.
+    """
+
+    def __init__(self, workspace: Workspace):
+        self.workspace = workspace
+
+    def generate_speech(self, text: str, speed: float = 1.0) -> Path:
+        digest = hashlib.sha1(f"{text}|{speed}".encode('utf-8')).digest()
+        pitch = 110.0 + digest[0] % 90
+        level = 0.1 + digest[1] / 255 * 0.2
+        t = np.arange(int((0.25 + 0.045 * len(text)) / speed * SAMPLE_RATE)) / SAMPLE_RATE
+        voice = sum(np.sin(2 * np.pi * pitch * harmonic * t) / harmonic for harmonic in range(1, 6))
+        voice *= 0.5 * (1 - np.cos(2 * np.pi * 4.0 * t)) * level
+        lead = np.zeros(int(0.12 * SAMPLE_RATE))
+        trail = np.zeros(int(0.2 * SAMPLE_RATE))
+        samples = np.concatenate([lead, voice, trail]).astype(np.float32)
+
+        path = self.workspace.path(f"{uuid.uuid4()}.wav")
+        write_wav(path, np.repeat(samples[:, np.newaxis], 2, axis=1))
+        self.workspace.commit(path)
+        return path
+
+    def cleanup(self):
+        pass
+
+def make_fixtures(workspace: Workspace) -> Tuple[Path, Path]:
+    """Write the source programme (WAV) and the subtitles (SRT) into the workspace"""
+    t = np.arange(int(FIXTURE_SECONDS * SAMPLE_RATE)) / SAMPLE_RATE
+    left = 0.25 * np.sin(2 * np.pi * 220 * t) + 0.05 * np.sin(2 * np.pi * 55 * t)
+    right = 0.25 * np.sin(2 * np.pi * 330 * t) + 0.05 * np.sin(2 * np.pi * 55 * t)
+    source = workspace.path('golden_source.wav')
+    write_wav(source, np.stack([left, right], axis=1).astype(np.float32))
+    workspace.commit(source)
+
+    def timestamp(seconds: float) -> str:
+        milliseconds = int(round(seconds * 1000))
+        return f"{milliseconds // 3600000:02d}:{milliseconds // 60000 % 60:02d}:{milliseconds // 1000 % 60:02d},{milliseconds % 1000:03d}"
+    subtitles = workspace.path('golden_subtitles.srt')
+    subtitles.write_text(''.join(
+        f"{index}\n{timestamp(start)} --> {timestamp(end)}\n{text}\n\n"
+        for index, (start, end, text) in enumerate(FIXTURE_CUES, 1)
+    ), encoding='utf-8')
+    workspace.commit(subtitles)
+    return source, subtitles
+
+def synthesize_clips(workspace: Workspace, subtitles: List[SubtitleEntry]) -> List[SpeechClip]:
+    """Speech clips of the fixture cues from the offline stand-in"""
+    engine = StandInSpeechEngine(workspace)
+    conditioner = ClipConditioner()
+    return [synthesize_cue(engine, conditioner, subtitle.text, subtitle.start_time, subtitle.end_time,
+                           speed=SPEECH_SPEED) for subtitle in subtitles]
+
+def decode(path: Path, channels: int) -> np.ndarray:
+    """Decode the audio of `path` as a player presents it, to float32 samples of shape (frames, channels).
+
+    The samples before time 0 are the encoder delay and are dropped.
+    """
+    decoded = tool_runner.run([
+        'ffmpeg', '-v', 'error', '-copyts', '-i', str(path), '-af', 'atrim=start=0',
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), '-ac', str(channels), 'pipe:1'
+    ], capture_output=True).stdout
+    return np.frombuffer(decoded, dtype='<i2').reshape(-1, channels).astype(np.float32) / 32768.0
+
+def check_multichannel(workspace: Workspace) -> List[str]:
+    """Mix the fixture cues over a 5.1 source and check that only the center channel changes"""
+    _, subtitle_path = make_fixtures(workspace)
+    t = np.arange(int(FIXTURE_SECONDS * SAMPLE_RATE)) / SAMPLE_RATE
+    source = workspace.path('golden_source_51.wav')
+    write_wav(source, np.stack([0.2 * np.sin(2 * np.pi * pitch * t) for pitch in MULTICHANNEL_TONES],
+                               axis=1).astype(np.float32))
+    workspace.commit(source)
+    original, _ = read_wav(source)
+
+    mixer = AudioMixer(workspace)
+    mixer.schedule_clips(synthesize_clips(workspace, SubtitleProcessor().parse_srt(str(subtitle_path))), source)
+    mix = to_pcm16(np.concatenate(list(mixer.iter_mixed_blocks(0, len(original), release_clips=False))))
+    original = to_pcm16(original)
+
+    failures = []
+    names = channel_names(mixer.channel_layout, mixer.channels)
+    center = names.index('FC')
+    if mixer.dialogue_channels != slice(center, center + 1):
+        failures.append(f"voiceover mixed into channels {mixer.dialogue_channels}, not FC")
+    for index, name in enumerate(names):
+        if index == center:
+            continue
+        differing = int(np.count_nonzero(mix[:, index] != original[:, index]))
+        print(f"  {name}: {differing} samples differ from the source")
+        if differing:
+            failures.append(f"5.1 {name}: {differing} samples differ from the source")
+    voice = (mix[:, center].astype(np.float32) - original[:, center]) / 32768.0
+    voiced = np.zeros(len(voice), dtype=bool)
+    for index, mix_input in enumerate(mixer.mix_inputs):
+        start = int(round(mix_input['start'] * SAMPLE_RATE))
+        end = int(round((mix_input['start'] + mix_input['duration']) * SAMPLE_RATE))
+        voiced[start:end] = True
+        level = _rms_db(voice[start:end])
+        print(f"  FC: cue {index + 1} adds {level:.1f} dB")
+        if level < MULTICHANNEL_VOICE_DB:
+            failures.append(f"5.1 FC: cue {index + 1} adds only {level:.1f} dB (at least {MULTICHANNEL_VOICE_DB} dB)")
+    differing = int(np.count_nonzero(voice[~voiced]))
+    print(f"  FC: {differing} samples outside the cues differ from the source")
+    if differing:
+        failures.append(f"5.1 FC: {differing} samples outside the cues differ from the source")
+    return failures
+
+def _speech(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Words of 1-4 syllables (a noise burst, then a voiced vowel with a moving pitch) between pauses"""
+    samples = np.zeros(int(seconds * SAMPLE_RATE))
+    position = 0
+    while position < len(samples):
+        for _ in range(rng.integers(1, 5)):
+            burst = int(rng.uniform(0.06, 0.1) * SAMPLE_RATE)
+            vowel = int(rng.uniform(0.12, 0.25) * SAMPLE_RATE)
+            t = np.arange(vowel) / SAMPLE_RATE
+            pitch = rng.uniform(100, 180) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 3) * t))
+            phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+            syllable = np.concatenate([
+                rng.normal(size=burst) * 0.05 * np.hanning(burst),
+                sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 20)) * np.hanning(vowel) * 0.2,
+            ])
+            syllable = syllable[:len(samples) - position]
+            samples[position:position + len(syllable)] += syllable
+            position += len(syllable)
+        position += int(rng.uniform(0.1, 0.35) * SAMPLE_RATE)
+    return samples
+
+def _music(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """A sustained chord with a slow tremolo over a kick drum and hi-hats"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    chord = sum(0.05 * np.sin(2 * np.pi * pitch * t + index) * (0.6 + 0.4 * np.sin(2 * np.pi * 0.25 * t + index))
+                for index, pitch in enumerate((220, 277, 330, 440, 370, 294)))
+    kick = 0.3 * np.sin(2 * np.pi * 60 * t) * np.exp(-(t % 0.5) * 20)
+    hihat = 0.05 * rng.normal(size=len(t)) * np.exp(-(t % 0.25) * 60)
+    return chord + kick + hihat
+
+def _staccato_piano(seconds: float) -> np.ndarray:
+    """Decaying notes twice a second; the hardest music for the low-energy measure"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = np.zeros(len(t))
+    for index, start in enumerate(np.arange(0, seconds, 0.5)):
+        note = t >= start
+        samples[note] += 0.2 * np.sin(2 * np.pi * (262, 294, 330, 349, 392, 440, 494)[index % 7] * (t[note] - start)) \
+            * np.exp(-(t[note] - start) * 3)
+    return samples
+
+def check_analysis(workspace: Workspace) -> List[str]:
+    """Label the analysis fixtures and check every interval and the resulting cue treatments"""
+    rng = np.random.default_rng(0)
+    seconds = ANALYSIS_SEGMENT_SECONDS
+    fixtures = [
+        ('speech', 'speech', _speech(seconds, rng)),
+        ('speech over a music bed at half level', 'speech', _speech(seconds, rng) + 0.5 * _music(seconds, rng)),
+        ('music', 'music', _music(seconds, rng)),
+        ('staccato piano', 'music', _staccato_piano(seconds)),
+        ('silence', 'silence', np.zeros(seconds * SAMPLE_RATE)),
+    ]
+    source = workspace.path('analysis_fixtures.wav')
+    samples = np.concatenate([fixture for _, _, fixture in fixtures]).astype(np.float32)
+    write_wav(source, np.repeat(samples[:, np.newaxis], 2, axis=1))
+    workspace.commit(source)
+    analysis = SourceAnalyzer().analyze(source)
+
+    failures = []
+    for index, (name, expected, _) in enumerate(fixtures):
+        intervals = slice(int(index * seconds / analysis.interval_seconds),
+                          int((index + 1) * seconds / analysis.interval_seconds))
+        labels = [LABELS[label] for label in analysis.labels[intervals]]
+        print(f"  {name}: {', '.join(labels)} (speech score {float(np.min(analysis.speech_score[intervals])):.2f}"
+              f"-{float(np.max(analysis.speech_score[intervals])):.2f})")
+        wrong = sum(label != expected for label in labels)
+        if wrong:
+            failures.append(f"{name}: {wrong} of {len(labels)} intervals not labelled {expected}")
+        label = analysis.label(index * seconds, (index + 1) * seconds)
+        treatments = (cue_treatment(False, label), cue_treatment(True, label))
+        if treatments != ANALYSIS_TREATMENTS[expected]:
+            failures.append(f"{name}: cues treated as {treatments}, expected {ANALYSIS_TREATMENTS[expected]}")
+    workspace.release(source)
+    return failures
+
+def render(workspace: Workspace, encoded: bool = False, codec: str = 'ac3') -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, int]]]:
+    """Run the fixtures through the pipeline.
+
+    Returns (mix, voice, voiced regions as (start, end) samples). The voice
+    is a second pass over a silent source, mixed to mono; everything in it
+    moves with the clips, so onsets can be measured on it exactly. With
+    `encoded` both are the decoded final tracks instead of the mixer's PCM.
+    """
+    source_path, subtitle_path = make_fixtures(workspace)
+    silent_path = workspace.path('golden_silence.wav')
+    write_wav(silent_path, np.zeros((int(FIXTURE_SECONDS * SAMPLE_RATE), 2), dtype=np.float32))
+    workspace.commit(silent_path)
+    subtitles = SubtitleProcessor().parse_srt(str(subtitle_path))
+
+    outputs = []
+    for path in (source_path, silent_path):
+        mixer = AudioMixer(workspace, codec=codec, encode_workers=2, chunk_seconds=GOLDEN_CHUNK_SECONDS)
+        # The final encode releases the clips it has mixed, so each pass gets its own (identical) clips
+        mixer.schedule_clips(synthesize_clips(workspace, subtitles), path)
+        total_frames = mixer.timeline_frames()
+        if encoded:
+            final_audio = mixer.save_final_audio()
+            outputs.append(_fit(decode(final_audio, mixer.channels), total_frames))
+            workspace.release(final_audio)
+        else:
+            outputs.append(np.concatenate(list(mixer.iter_mixed_blocks(0, total_frames, release_clips=False))))
+
+    regions = [(int(round(mix['start'] * SAMPLE_RATE)), int(round((mix['start'] + mix['duration']) * SAMPLE_RATE)))
+               for mix in mixer.mix_inputs]
+    return outputs[0], outputs[1].mean(axis=1), regions
+
+def check_joins(workspace: Workspace, codec: str) -> List[str]:
+    """Compare the chunked final encode of the fixture mix with a single-pass encode of it"""
+    source_path, subtitle_path = make_fixtures(workspace)
+    mixer = AudioMixer(workspace, codec=codec, encode_workers=2, chunk_seconds=GOLDEN_CHUNK_SECONDS)
+    mixer.schedule_clips(synthesize_clips(workspace, SubtitleProcessor().parse_srt(str(subtitle_path))), source_path)
+    total_frames = mixer.timeline_frames()
+    single_path = workspace.path(f'golden_single.{codec}.mka')
+    encode_blocks(mixer.iter_mixed_blocks(0, total_frames, release_clips=False), single_path,
+                  mixer.codec, mixer.channels, mixer.channel_layout)
+    single = decode(single_path, mixer.channels)
+    chunked_path = mixer.save_final_audio()
+    chunked = decode(chunked_path, mixer.channels)
+    workspace.release(single_path)
+    workspace.release(chunked_path)
+
+    joins = [end for _, end in plan_chunks(total_frames, mixer.codec, GOLDEN_CHUNK_SECONDS)[:-1]]
+    print(f"  {len(joins)} joins, {len(chunked)} samples (single pass {len(single)})")
+    if len(chunked) != len(single):
+        return [f"chunked track has {len(chunked)} samples, single pass {len(single)}"]
+    if codec in EXACT_JOIN_CODECS:
+        differing = int(np.count_nonzero(chunked != single))
+        return [f"{differing} samples differ from the single pass"] if differing else []
+    failures = []
+    for join in joins:
+        window = slice(max(0, join - JOIN_WINDOW), join + JOIN_WINDOW)
+        level = _rms_db(single[window])
+        error = _rms_db(chunked[window] - single[window])
+        print(f"  join at {join / SAMPLE_RATE:.3f}s: level {level:.1f} dB, difference {error:.1f} dB")
+        if error > max(level - JOIN_SNR_DB[codec], JOIN_SILENCE_DB):
+            failures.append(f"join at {join / SAMPLE_RATE:.3f}s differs from the single pass by {error:.1f} dB "
+                            f"at {level:.1f} dB (tolerance {JOIN_SNR_DB[codec]} dB below the level)")
+    return failures
+
+def _fit(samples: np.ndarray, frames: int) -> np.ndarray:
+    """Cut or zero-pad to exactly `frames` frames"""
+    if len(samples) >= frames:
+        return samples[:frames]
+    return np.concatenate([samples, np.zeros((frames - len(samples), samples.shape[1]), dtype=samples.dtype)])
+
+def _rms_db(samples: np.ndarray) -> float:
+    return float(10 * np.log10(np.mean(np.square(samples, dtype=np.float64)) + 1e-12))
+
+def onset_lag(reference: np.ndarray, signal: np.ndarray, onset: int) -> int:
+    """Samples by which `signal` lags `reference` around `onset` (normalized cross-correlation)
+
+    Both are voice-only renders, so the waveforms themselves are compared;
+    the window starts a little before the onset to include its edge.
+    """
+    lo = max(0, onset - ONSET_WINDOW // 4)
+    window = reference[lo:lo + ONSET_WINDOW]
+    search_lo = max(0, lo - ONSET_SEARCH)
+    search = signal[search_lo:lo + ONSET_WINDOW + ONSET_SEARCH]
+    correlation = np.correlate(search, window, mode='valid')
+    energy = np.convolve(np.square(search), np.ones(len(window)), mode='valid')
+    score = correlation / np.sqrt(energy * np.sum(np.square(window)) + 1e-20)
+    return int(np.argmax(score)) + search_lo - lo
+
+def analyze(mix: np.ndarray, regions: List[Tuple[int, int]]) -> Dict:
+    return {
+        'frames': len(mix),
+        'onsets': [start for start, _ in regions],
+        'regions': [list(region) for region in regions],
+        'region_rms_db': [_rms_db(mix[start:end]) for start, end in regions],
+        'clipped_samples': int(np.count_nonzero(np.abs(mix) >= 32767 / 32768)),
+    }
+
+def compare(mix: np.ndarray, voice: np.ndarray, golden_mix: np.ndarray, golden_voice: np.ndarray, golden: Dict,
+            onset_tolerance: int, rms_tolerance: float, sample_tolerance: Optional[float]) -> List[str]:
+    """Return the failed checks (empty if the output matches the golden audio)"""
+    failures = []
+    if len(mix) != golden['frames']:
+        failures.append(f"length {len(mix)} samples, golden {golden['frames']}")
+        mix = _fit(mix, golden['frames'])
+        voice = _fit(voice[:, np.newaxis], golden['frames'])[:, 0]
+
+    for index, onset in enumerate(golden['onsets']):
+        lag = onset_lag(golden_voice, voice, onset)
+        print(f"  cue {index + 1}: onset {onset} lag {lag:+d} samples")
+        if abs(lag) > onset_tolerance:
+            failures.append(f"cue {index + 1} onset moved by {lag:+d} samples (tolerance {onset_tolerance})")
+
+    # The voiced regions are where the original is ducked under the voiceover
+    for index, ((start, end), golden_rms) in enumerate(zip(golden['regions'], golden['region_rms_db'])):
+        rms = _rms_db(mix[start:end])
+        print(f"  cue {index + 1}: RMS {rms:.2f} dB (golden {golden_rms:.2f} dB)")
+        if abs(rms - golden_rms) > rms_tolerance:
+            failures.append(f"cue {index + 1} RMS {rms:.2f} dB, golden {golden_rms:.2f} dB (tolerance {rms_tolerance} dB)")
+
+    clipped = int(np.count_nonzero(np.abs(mix) >= 32767 / 32768))
+    if clipped:
+        failures.append(f"{clipped} clipped samples")
+
+    if sample_tolerance is not None:
+        max_error = float(np.max(np.abs(mix - golden_mix))) * 32768
+        print(f"  largest sample difference: {max_error:.1f} LSB")
+        if max_error > sample_tolerance:
+            failures.append(f"sample-wise difference {max_error:.1f} LSB (tolerance {sample_tolerance} LSB)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Golden-audio regression check for the mixing pipeline')
+    parser.add_argument('--update', action='store_true', help='Write the current output as the new golden audio')
+    parser.add_argument('--no-encoded', action='store_true',
+                        help='Skip the encoded checks (they run whenever ffmpeg is installed)')
+    parser.add_argument('--codecs', nargs='+', default=sorted(AUDIO_CODECS), choices=sorted(AUDIO_CODECS),
+                        help='Codecs of the encoded checks (default: all)')
+    parser.add_argument('--golden-dir', default=str(GOLDEN_DIR), help='Directory of the golden files (default: %(default)s)')
+    parser.add_argument('--onset-tolerance', type=int, default=48, help='Samples (default: %(default)s)')
+    parser.add_argument('--rms-tolerance', type=float, default=0.1, help='dB (default: %(default)s)')
+    parser.add_argument('--sample-tolerance', type=float, default=8.0, help='16-bit LSB (default: %(default)s)')
+    args = parser.parse_args()
+
+    golden_dir = Path(args.golden_dir)
+    start_time = time.perf_counter()
+    workspace = Workspace()
+    try:
+        mix, voice, regions = render(workspace)
+        if args.update:
+            golden_dir.mkdir(parents=True, exist_ok=True)
+            write_wav(golden_dir / 'mix.wav', mix)
+            write_wav(golden_dir / 'voice.wav', voice)
+            (golden_dir / 'mix.json').write_text(json.dumps(analyze(mix, regions), indent=2) + '\n',
+                                                 encoding='utf-8')
+            print(f"Golden audio written to {golden_dir}")
+            return
+
+        golden = json.loads((golden_dir / 'mix.json').read_text(encoding='utf-8'))
+        golden_mix, _ = read_wav(golden_dir / 'mix.wav')
+        golden_voice = read_wav(golden_dir / 'voice.wav')[0][:, 0]
+        print("Mixer output:")
+        failures = compare(mix, voice, golden_mix, golden_voice, golden, args.onset_tolerance,
+                           args.rms_tolerance, args.sample_tolerance)
+        print("5.1 mix:")
+        failures += check_multichannel(workspace)
+        print("Source analysis:")
+        failures += [f"analysis: {failure}" for failure in check_analysis(workspace)]
+
+        codecs = [] if args.no_encoded else args.codecs
+        if codecs and shutil.which('ffmpeg') is None:
+            print("ffmpeg not found; skipping the encoded checks")
+            codecs = []
+        for codec in codecs:
+            encoded_workspace = Workspace()
+            try:
+                encoded_mix, encoded_voice, _ = render(encoded_workspace, encoded=True, codec=codec)
+                print(f"Encoded ({codec}) output:")
+                # Lossy codecs change the waveform, so only timing and levels are checked, more loosely;
+                # Matroska timestamps are whole milliseconds, so the encoder delay is dropped to within 1 ms
+                failures += [f"encoded {codec}: {failure}" for failure in compare(
+                    encoded_mix, encoded_voice, golden_mix, golden_voice, golden,
+                    onset_tolerance=max(args.onset_tolerance, SAMPLE_RATE // 1000),
+                    rms_tolerance=max(args.rms_tolerance, 1.0),
+                    sample_tolerance=None)]
+                print(f"Encoded ({codec}) joins:")
+                failures += [f"encoded {codec}: {failure}" for failure in check_joins(encoded_workspace, codec)]
+            finally:
+                encoded_workspace.cleanup()
+    finally:
+        workspace.cleanup()
+
+    print(f"Checked in {time.perf_counter() - start_time:.2f} seconds")
+    if failures:
+        print("Golden-audio check FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("Golden-audio check passed")
+
+if __name__ == "__main__":
+    main()
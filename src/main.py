@@ -4,64 +4,277 @@ from pathlib import Path
 from media_processor import MediaProcessor
 from subtitle_processor import SubtitleProcessor, SubtitleEntry
 from audio_mixer import AudioMixer
-from tts_engine import TTSEngine
-import re
+from audio_encoder import AUDIO_CODECS
+from tts_engine import TTSEngine, SpeechClip, synthesize_cue
+from clip_conditioner import ClipConditioner
+from pcm_io import SAMPLE_RATE
+from source_analysis import SourceAnalyzer
+from progress import JsonLinesSink, ProgressReporter
+from tts_transport import PooledTransport, DEFAULT_POOL_SIZE
+from workspace import Workspace, DEFAULT_MEMORY_BUDGET
+from work_queue import DirectoryWorkQueue, Shard, WorkQueue
+import tool_runner
+from tool_runner import ToolUsage
+from dataclasses import asdict
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import List, Tuple
+import threading
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
 from tqdm import tqdm  # For progress bar
-import tempfile
-import hashlib
 import time
 import traceback
 
+# Playback speed of the generated speech
+SPEECH_SPEED = 1.25
+
+# Length of a preview when only --start is given
+DEFAULT_PREVIEW_SECONDS = 60.0
+
+def parse_timestamp(value: str) -> float:
+    """Seconds from '90', '1:30' or '01:01:30.5'"""
+    seconds = 0.0
+    for part in value.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_ranges(spec: str) -> List[Tuple[float, float]]:
+    """Time ranges from 'START-END[,START-END...]', e.g. '10:00-11:30,1:02:00-1:03:00'"""
+    ranges = []
+    for item in spec.split(','):
+        start, _, end = item.partition('-')
+        if not end:
+            raise ValueError(f"Range {item!r} is not START-END")
+        ranges.append((parse_timestamp(start), parse_timestamp(end)))
+    return ranges
+
+def normalize_ranges(ranges: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Sort the ranges and merge overlapping ones"""
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            raise ValueError(f"Range {start:g}-{end:g} ends before it starts")
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
 class AIDubber:
-    def __init__(self, language: str = 'et'):
-        self.media_processor = MediaProcessor()
+    def __init__(self, language: str = 'et', prefer_memory: bool = True,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET, tts_endpoint: Optional[str] = None,
+                 tts_pool_size: int = DEFAULT_POOL_SIZE, executor: Optional[Executor] = None,
+                 clip_cache_dir: Optional[str] = None, work_queue: Optional[WorkQueue] = None,
+                 shard_size: int = 25, stall_timeout: float = 600.0, streaming: bool = False,
+                 output_mode: str = 'sidecar', codec: str = 'ac3',
+                 preview_ranges: Optional[List[Tuple[float, float]]] = None,
+                 progress: Optional[ProgressReporter] = None, analyze_source: bool = True,
+                 dialogue_channel: Optional[str] = None):
+        # One workspace holds the intermediates of every stage
+        self.workspace = Workspace(prefer_memory=prefer_memory, memory_budget=memory_budget)
+        self.media_processor = MediaProcessor(self.workspace)
         self.subtitle_processor = SubtitleProcessor()
-        self.audio_mixer = AudioMixer()
-        self.tts_engine = TTSEngine(language)
+        self.audio_mixer = AudioMixer(self.workspace, codec=codec, dialogue_channel=dialogue_channel)
+        # Mix, encode and mux in one pass without intermediate audio files
+        self.streaming = streaming
+        # 'sidecar' writes only the dubbed track (.mka); 'remux' rewrites the whole video
+        self.output_mode = output_mode
+        # Only these time ranges are synthesized, mixed and written, as one short clip
+        self.preview_ranges = normalize_ranges(preview_ranges) if preview_ranges else None
+        self.tts_engine = TTSEngine(language, self.workspace,
+                                    PooledTransport(endpoint=tts_endpoint, pool_size=tts_pool_size),
+                                    cache_dir=clip_cache_dir)
+        self.clip_conditioner = ClipConditioner()
+        # Speech/music labels of the source decide how each cue is mixed; without them the subtitle tags do
+        self.source_analyzer = SourceAnalyzer() if analyze_source else None
         self.language = language
+        # A long-lived executor (e.g. from the dubbing server) is reused instead of spawning a pool per file
+        self.executor = executor
+        # With a work queue, synthesis is sharded across worker nodes instead of the local pool
+        self.work_queue = work_queue
+        self.shard_size = shard_size
+        self.stall_timeout = stall_timeout
+        self.job_id = None
+        # Wall-clock seconds spent in each stage of the last process_file call
+        self.stage_metrics: Dict[str, float] = {}
+        # External tool runs (ffmpeg, mkvmerge, ...) of each stage of the last process_file call
+        self.tool_usage: Dict[str, List[ToolUsage]] = {}
+        # Stage, per-line and throughput events for orchestrators
+        self.progress = progress or ProgressReporter()
         
-        # Create temp directory with a short path to avoid Windows path length limitations
-        temp_base = os.environ.get('TEMP', tempfile.gettempdir())
-        short_dir_name = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
-        self.temp_dir = Path(temp_base) / short_dir_name
-        self.temp_dir.mkdir(exist_ok=True)
-        
-        print(f"Temporary directory: {self.temp_dir}")
+        print(f"Temporary directory: {self.workspace.root}")
         print(f"Using language: {language}")
     
-    def process_subtitle_chunk(self, chunk: List[SubtitleEntry], video_path: Path, temp_dir: Path) -> List[Tuple[float, Path, float, float, bool]]:
-        """Process a chunk of subtitles and return timing/audio data"""
+    def __getstate__(self):
+        # Chunks are processed in worker processes, which get no executor of their own
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['progress'] = None
+        return state
+
+    @contextmanager
+    def _stage(self, name: str):
+        start_time = time.perf_counter()
+        self.progress.stage_start(name)
+        try:
+            with tool_runner.track_usage() as records:
+                yield
+        finally:
+            self.stage_metrics[name] = self.stage_metrics.get(name, 0.0) + time.perf_counter() - start_time
+            self.tool_usage.setdefault(name, []).extend(records)
+            self.progress.stage_end(name)
+
+    def tool_metrics(self) -> Dict[str, dict]:
+        """Per stage and tool: calls, failures, timeouts, wall and CPU seconds, peak RSS"""
+        return {stage: tool_runner.summarize_usage(records) for stage, records in self.tool_usage.items() if records}
+
+    def _print_tool_costs(self, top: int = 3):
+        runs = [(stage, usage) for stage, records in self.tool_usage.items() for usage in records]
+        if not runs:
+            return
+        print("Costliest tool runs:")
+        runs.sort(key=lambda run: run[1].cpu_seconds if run[1].cpu_seconds is not None else run[1].wall_seconds,
+                  reverse=True)
+        for stage, usage in runs[:top]:
+            cpu = f"{usage.cpu_seconds:.1f}s CPU" if usage.cpu_seconds is not None else "CPU n/a"
+            rss = f"{usage.max_rss_bytes / (1024 * 1024):.0f} MB" if usage.max_rss_bytes is not None else "RSS n/a"
+            print(f"  [{stage}] {usage.tool}: {usage.wall_seconds:.1f}s wall, {cpu}, {rss}: {usage.command[:80]}")
+
+    def process_subtitle_chunk(self, chunk: List[SubtitleEntry], video_path: Path,
+                               progress_queue=None, first_index: int = 0) -> List[SpeechClip]:
+        """Process a chunk of subtitles and return timing/audio data.
+
+        With a progress_queue, (line index, ok, clip bytes) is put on it as each line finishes.
+        """
         results = []
-        for subtitle in chunk:
+        for offset, subtitle in enumerate(chunk):
             try:
-                # Check if it's lyrics (has HTML tags)
-                is_lyrics = '<i>' in subtitle.text.lower() or '</i>' in subtitle.text.lower()
-                
-                # Clean the text - only remove HTML tags and quotation marks
-                clean_text = re.sub(r'<[^>]*>', '', subtitle.text)  # Remove HTML tags
-                clean_text = re.sub(r'["""„]', '', clean_text)  # Remove various quote marks
-                clean_text = clean_text.strip()  # Just trim whitespace
-                
-                # Generate TTS audio
-                tts_audio = self.tts_engine.generate_speech(clean_text, speed=1.25)
-                
-                # Return tuple of (start_time, audio_path, duration, end_time, is_lyrics)
-                results.append((
-                    subtitle.start_time,
-                    tts_audio,
-                    subtitle.end_time - subtitle.start_time,
-                    subtitle.end_time,
-                    is_lyrics
-                ))
+                clip = synthesize_cue(self.tts_engine, self.clip_conditioner, subtitle.text,
+                                      subtitle.start_time, subtitle.end_time, speed=SPEECH_SPEED)
+                results.append(clip)
+                if progress_queue is not None:
+                    progress_queue.put((first_index + offset, True, os.path.getsize(clip.path)))
             except Exception as e:
                 print(f"Error processing subtitle: {str(e)}")
+                if progress_queue is not None:
+                    progress_queue.put((first_index + offset, False, 0))
                 continue
         return results
 
+    def synthesize_subtitles(self, subtitles: List[SubtitleEntry], video_path: Path) -> List[SpeechClip]:
+        """Generate speech for all subtitles in parallel, sorted by start time"""
+        self.progress.set_total(len(subtitles), 'lines')
+        if self.work_queue is not None:
+            return self.synthesize_sharded(subtitles)
+        
+        # Calculate chunks based on CPU cores
+        num_cores = multiprocessing.cpu_count()
+        chunk_size = max(1, len(subtitles) // num_cores)
+        subtitle_chunks = [subtitles[i:i + chunk_size] for i in range(0, len(subtitles), chunk_size)]
+        
+        # Workers report finished lines through a manager queue, only if anyone is listening
+        manager = progress_queue = relay = None
+        if self.progress.active:
+            manager = multiprocessing.Manager()
+            progress_queue = manager.Queue()
+            def relay_progress():
+                for index, ok, nbytes in iter(progress_queue.get, None):
+                    self.progress.advance(1, nbytes=nbytes, item=index, ok=ok)
+            relay = threading.Thread(target=relay_progress, daemon=True)
+            relay.start()
+        
+        # Process chunks in parallel
+        all_results = []
+        pool = nullcontext(self.executor) if self.executor is not None else ProcessPoolExecutor(max_workers=num_cores)
+        try:
+            with pool as executor:
+                # Submit all chunks for processing
+                future_to_chunk = {
+                    executor.submit(
+                        tool_runner.call_tracked,
+                        self.process_subtitle_chunk, 
+                        chunk, 
+                        video_path,
+                        progress_queue,
+                        i * chunk_size
+                    ): i for i, chunk in enumerate(subtitle_chunks)
+                }
+                
+                # Collect results as they complete
+                for future in tqdm(as_completed(future_to_chunk), total=len(subtitle_chunks), desc="Processing subtitle chunks"):
+                    chunk_results, usage = future.result()
+                    tool_runner.add_usage(usage)
+                    all_results.extend(chunk_results)
+        finally:
+            if manager is not None:
+                progress_queue.put(None)
+                relay.join()
+                manager.shutdown()
+        
+        # Sort results by start time
+        all_results.sort(key=lambda clip: clip.start_time)
+        return all_results
+
+    def synthesize_sharded(self, subtitles: List[SubtitleEntry]) -> List[SpeechClip]:
+        """Hand synthesis to shard workers through the work queue and wait for their clips"""
+        self.job_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        shards = []
+        for shard_index, i in enumerate(range(0, len(subtitles), self.shard_size)):
+            lines = [dict(asdict(subtitle), index=i + offset)
+                     for offset, subtitle in enumerate(subtitles[i:i + self.shard_size])]
+            shards.append(Shard(
+                job_id=self.job_id,
+                shard_id=f"{shard_index:06d}",
+                language=self.language,
+                speed=SPEECH_SPEED,
+                lines=lines
+            ))
+        self.work_queue.submit(shards)
+        print(f"Submitted {len(shards)} shards as job {self.job_id}; waiting for workers...")
+        
+        shard_lines = {shard.shard_id: [line['index'] for line in shard.lines] for shard in shards}
+        pending = {shard.shard_id for shard in shards}
+        results = {}
+        last_progress = time.time()
+        with tqdm(total=len(shards), desc="Synthesizing shards") as progress:
+            while pending:
+                finished = {shard_id: result for shard_id, result in self.work_queue.results(self.job_id).items()
+                            if shard_id in pending}
+                failed = {shard_id: shard for shard_id, shard in self.work_queue.failed(self.job_id).items()
+                          if shard_id in pending}
+                for shard_id, shard in failed.items():
+                    print(f"Shard {shard_id} failed after {shard.attempt} attempts: {shard.error}")
+                results.update(finished)
+                pending -= set(finished) | set(failed)
+                for shard_id in failed:
+                    for index in shard_lines[shard_id]:
+                        self.progress.advance(1, item=index, ok=False)
+                for shard_id, result in finished.items():
+                    for index in shard_lines[shard_id]:
+                        self.progress.advance(1, item=index, ok=index not in result.failed_lines)
+                if finished or failed:
+                    progress.update(len(finished) + len(failed))
+                    last_progress = time.time()
+                elif time.time() - last_progress > self.stall_timeout:
+                    raise RuntimeError(f"No shard finished in {self.stall_timeout:.0f} seconds; are any workers running on the queue?")
+                if pending:
+                    self.work_queue.requeue_expired(self.job_id)
+                    time.sleep(0.5)
+        
+        all_results = []
+        for result in results.values():
+            if result.failed_lines:
+                print(f"Worker {result.worker} could not synthesize {len(result.failed_lines)} lines of shard {result.shard_id}")
+            for clip in result.clips:
+                all_results.append(SpeechClip(**dict(clip, path=Path(clip['path']))))
+        all_results.sort(key=lambda clip: clip.start_time)
+        return all_results
+
     def process_file(self, video_path: str, subtitle_path: str, output_path: str):
+        self.stage_metrics = {}
+        self.tool_usage = {}
         try:
             # Validate paths and create full paths
             video_path = os.path.abspath(video_path)
@@ -74,10 +287,12 @@ class AIDubber:
                 video_path_obj = Path(video_path)
                 
                 # Load the video file
-                video = self.media_processor.load_video(video_path)
+                with self._stage('load'):
+                    video = self.media_processor.load_video(video_path)
                 
                 # Extract subtitles from the video file
-                extracted_subtitle_path, available_languages = self.media_processor.extract_subtitles(video, language_code)
+                with self._stage('subtitles'):
+                    extracted_subtitle_path, available_languages = self.media_processor.extract_subtitles(video, language_code)
                 
                 if extracted_subtitle_path is None:
                     if available_languages:
@@ -90,9 +305,16 @@ class AIDubber:
             else:
                 subtitle_path = os.path.abspath(subtitle_path)
                 # Load the video file
-                video = self.media_processor.load_video(video_path)
+                with self._stage('load'):
+                    video = self.media_processor.load_video(video_path)
             
             output_path = os.path.abspath(output_path)
+            # The output suffix is set by the mode, so e.g. Movie.mka in remux mode writes Movie.mkv
+            written_path = Path(output_path).with_suffix('.mka' if self.output_mode == 'sidecar' else '.mkv')
+            for input_path in (video_path, subtitle_path):
+                if written_path.resolve() == Path(input_path).resolve():
+                    raise ValueError(f"The output {written_path} would overwrite the input {input_path}; "
+                                     f"choose another output name")
             
             print(f"Processing video: {video_path}")
             print(f"Using subtitles: {subtitle_path}")
@@ -105,60 +327,84 @@ class AIDubber:
                     print(f"  {path}")
             
             # Parse subtitles
-            subtitles = self.subtitle_processor.parse_srt(subtitle_path)
+            with self._stage('subtitles'):
+                subtitles = self.subtitle_processor.parse_srt(subtitle_path)
+                self.workspace.release(Path(subtitle_path))
             print(f"Found {len(subtitles)} subtitle entries")
+            if self.preview_ranges:
+                subtitles = [subtitle for subtitle in subtitles
+                             if any(subtitle.start_time < end and subtitle.end_time > start
+                                    for start, end in self.preview_ranges)]
+                print(f"Previewing {len(subtitles)} subtitle entries in "
+                      + ", ".join(f"{start:g}-{end:g}s" for start, end in self.preview_ranges))
             
-            # Calculate chunks based on CPU cores
-            num_cores = multiprocessing.cpu_count()
-            chunk_size = max(1, len(subtitles) // num_cores)
-            subtitle_chunks = [subtitles[i:i + chunk_size] for i in range(0, len(subtitles), chunk_size)]
-            
-            # Process chunks in parallel
-            all_results = []
-            with ProcessPoolExecutor(max_workers=num_cores) as executor:
-                # Submit all chunks for processing
-                future_to_chunk = {
-                    executor.submit(
-                        self.process_subtitle_chunk, 
-                        chunk, 
-                        Path(video_path),
-                        self.temp_dir
-                    ): i for i, chunk in enumerate(subtitle_chunks)
-                }
-                
-                # Collect results as they complete
-                for future in tqdm(as_completed(future_to_chunk), total=len(subtitle_chunks), desc="Processing subtitle chunks"):
-                    chunk_results = future.result()
-                    all_results.extend(chunk_results)
-            
-            # Sort results by start time
-            all_results.sort(key=lambda x: x[0])
+            with self._stage('synthesis'):
+                all_results = self.synthesize_subtitles(subtitles, Path(video_path))
             print(f"Generated speech for {len(all_results)} subtitle entries")
             
-            # Mix audio sequentially (can't parallelize this part easily)
-            last_end_time = 0.0
-            for start_time, tts_audio, duration, end_time, is_lyrics in tqdm(all_results, desc="Mixing audio"):
-                actual_start = max(last_end_time, start_time)
-                tts_length_secs = self.audio_mixer.mix_audio_segment(
-                    video,
-                    tts_audio,
-                    actual_start,
-                    duck_level=0.2,
-                    lyrics_mode=is_lyrics
-                )
-                last_end_time = actual_start + tts_length_secs
+            analysis = None
+            if self.source_analyzer is not None:
+                with self._stage('analysis'):
+                    analysis = self.source_analyzer.analyze(video, windows=self.preview_ranges, progress=self.progress)
             
-            # Save the final mixed audio
-            print("Creating final mixed audio track...")
-            final_audio = self.audio_mixer.save_final_audio()
+            # Mix audio sequentially (can't parallelize this part easily)
+            with self._stage('mixing'):
+                self.progress.set_total(len(all_results), 'clips')
+                self.audio_mixer.schedule_clips(tqdm(all_results, desc="Mixing audio"), video,
+                                                on_clip=self.progress.advance, analysis=analysis)
             
-            # Save the final video with language metadata
-            print(f"Creating final output file: {output_path}")
-            self.media_processor.save_video(video, final_audio, output_path, language=self.language)
+            sidecar = self.output_mode == 'sidecar'
+            if self.preview_ranges:
+                # Decode, mix and encode only the preview windows
+                print(f"Creating preview clip: {output_path}")
+                with self._stage('preview'):
+                    self.progress.set_total(sum(end - start for start, end in self.preview_ranges), 'seconds')
+                    blocks = chain.from_iterable(
+                        self.audio_mixer.iter_mixed_blocks(int(round(start * SAMPLE_RATE)),
+                                                           int(round(end * SAMPLE_RATE)),
+                                                           release_clips=False)
+                        for start, end in self.preview_ranges)
+                    output_path = self.media_processor.mux_preview(
+                        video, self.progress.track_blocks(blocks, SAMPLE_RATE), output_path, self.preview_ranges, language=self.language,
+                        channels=self.audio_mixer.channels, sidecar=sidecar, codec=self.audio_mixer.codec,
+                        layout=self.audio_mixer.channel_layout)
+                    self.workspace.release(video)
+            elif self.streaming:
+                # Mix, encode and mux in one pass
+                print(f"Mixing, encoding and muxing into: {output_path}")
+                with self._stage('mix_encode_mux'):
+                    if self.progress.active:
+                        self.progress.set_total(self.audio_mixer.timeline_frames() / SAMPLE_RATE, 'seconds')
+                    output_path = self.media_processor.mux_stream(
+                        video, self.progress.track_blocks(self.audio_mixer.iter_mixed_blocks(), SAMPLE_RATE), output_path,
+                        language=self.language, channels=self.audio_mixer.channels, sidecar=sidecar,
+                        codec=self.audio_mixer.codec, layout=self.audio_mixer.channel_layout)
+                    self.workspace.release(video)
+            else:
+                # Save the final mixed audio
+                print("Creating final mixed audio track...")
+                with self._stage('final_audio'):
+                    final_audio = self.audio_mixer.save_final_audio(progress=self.progress)
+                
+                with self._stage('mux'):
+                    if sidecar:
+                        # Only the dubbed track is written; the video is never copied
+                        print(f"Creating dubbed audio track: {output_path}")
+                        output_path = self.media_processor.save_sidecar(final_audio, output_path, language=self.language)
+                    else:
+                        # Save the final video with language metadata
+                        print(f"Creating final output file: {output_path}")
+                        self.media_processor.save_video(video, final_audio, output_path, language=self.language)
+                    self.workspace.release(final_audio)
+                    self.workspace.release(video)
             
             print(f"\nSuccess! Output saved to: {output_path}")
+            print("Stage timings: " + ", ".join(f"{name} {secs:.1f}s" for name, secs in self.stage_metrics.items()))
+            self._print_tool_costs()
+            self.progress.emit('job_end', status='done', output=output_path)
             
         except Exception as e:
+            self.progress.emit('job_end', status='failed', error=str(e))
             print(f"\nError during processing: {str(e)}")
             traceback.print_exc()
             raise
@@ -167,9 +413,8 @@ class AIDubber:
 
     def cleanup(self):
         """Clean up temporary files"""
-        import shutil
-        
         print("Cleaning up temporary files...")
+        print(f"Workspace usage: {self.workspace.usage_summary()}")
         
         try:
             self.tts_engine.cleanup()
@@ -181,9 +426,14 @@ class AIDubber:
         except Exception as e:
             print(f"Note: Audio mixer cleanup had an issue: {e}")
         
+        if self.work_queue is not None and self.job_id is not None:
+            try:
+                self.work_queue.close_job(self.job_id)
+            except Exception as e:
+                print(f"Note: Work queue cleanup had an issue: {e}")
+        
         try:
-            if self.temp_dir.exists():
-                shutil.rmtree(self.temp_dir)
+            self.workspace.cleanup()
         except Exception as e:
             print(f"Note: Temporary directory cleanup had an issue: {e}")
 
@@ -192,17 +442,63 @@ def main():
     parser = argparse.ArgumentParser(description='AI Video Dubbing Tool')
     parser.add_argument('video_path', help='Path to the input video file')
     parser.add_argument('subtitle_path', help='Path to the subtitle file (.srt format) or language code to extract from the video')
-    parser.add_argument('output_path', help='Path where the dubbed video will be saved')
+    parser.add_argument('output_path', help='Path where the dubbed audio track (or, with --output-mode remux, the dubbed video) will be saved')
     parser.add_argument('--language', '-l', default='et', help='Language code for TTS (default: et)')
+    parser.add_argument('--no-shm', action='store_true', help='Keep intermediates on disk instead of /dev/shm')
+    parser.add_argument('--shm-budget', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help='Megabytes of intermediates to keep in /dev/shm before spilling to disk (default: %(default)s)')
+    parser.add_argument('--tts-endpoint', help='Send gTTS requests to this base URL instead of Google (e.g. a local stand-in server)')
+    parser.add_argument('--tts-pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='Keep-alive connections (and concurrent token fetches) per worker process (default: %(default)s)')
+    parser.add_argument('--output-mode', choices=['sidecar', 'remux'], default='sidecar',
+                        help='sidecar: write only the dubbed track as .mka; remux: write a full copy of the video with the dubbed track (default: %(default)s)')
+    parser.add_argument('--codec', choices=sorted(AUDIO_CODECS), default='ac3',
+                        help='Codec of the dubbed audio track (default: %(default)s)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Mix in blocks and pipe the audio straight into the encoder and muxer, without intermediate audio files')
+    parser.add_argument('--queue-dir', help='Shard synthesis through this shared work queue directory (run src/shard_worker.py against it)')
+    parser.add_argument('--shard-size', type=int, default=25, help='Subtitle lines per shard (default: %(default)s)')
+    parser.add_argument('--progress-fd', type=int,
+                        help='Write progress events as JSON lines to this file descriptor (e.g. 3)')
+    parser.add_argument('--progress-socket',
+                        help='Write progress events as JSON lines to this Unix socket path or host:port')
+    parser.add_argument('--start', type=parse_timestamp,
+                        help='Preview from this time (seconds or [HH:]MM:SS); only cues in the window are dubbed')
+    parser.add_argument('--end', type=parse_timestamp,
+                        help=f'End of the preview window (default: start + {DEFAULT_PREVIEW_SECONDS:g}s)')
+    parser.add_argument('--ranges', type=parse_ranges,
+                        help='Preview several windows, e.g. 10:00-11:30,1:02:00-1:03:00 (played back to back)')
+    parser.add_argument('--dialogue-channel',
+                        help="Channel that gets the voiceover and the ducking: a name such as FC or FL, an index, or 'all' "
+                             "(default: the center channel if the source has one, otherwise all channels)")
+    parser.add_argument('--no-source-analysis', action='store_true',
+                        help='Do not analyze the original audio for speech and music; treat cues by their subtitle tags only')
     
     args = parser.parse_args()
     
+    preview_ranges = list(args.ranges or [])
+    if args.start is not None or args.end is not None:
+        start = args.start or 0.0
+        preview_ranges.append((start, args.end if args.end is not None else start + DEFAULT_PREVIEW_SECONDS))
+    
+    progress = ProgressReporter()
     try:
-        dubber = AIDubber(language=args.language)
+        if args.progress_fd is not None or args.progress_socket:
+            progress.subscribe(JsonLinesSink(fd=args.progress_fd, address=args.progress_socket))
+        dubber = AIDubber(language=args.language, prefer_memory=not args.no_shm,
+                          memory_budget=args.shm_budget * 1024 * 1024,
+                          tts_endpoint=args.tts_endpoint, tts_pool_size=args.tts_pool_size,
+                          work_queue=DirectoryWorkQueue(args.queue_dir) if args.queue_dir else None,
+                          shard_size=args.shard_size, streaming=args.stream,
+                          output_mode=args.output_mode, codec=args.codec,
+                          preview_ranges=preview_ranges or None, progress=progress,
+                          analyze_source=not args.no_source_analysis, dialogue_channel=args.dialogue_channel)
         dubber.process_file(args.video_path, args.subtitle_path, args.output_path)
     except Exception as e:
         print(f"Fatal error: {str(e)}")
         sys.exit(1)
+    finally:
+        progress.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
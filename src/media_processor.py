@@ -3,29 +3,48 @@ from pathlib import Path
 import tempfile
 import shutil
 import os
-import hashlib
 import time
-from typing import List, Optional
+from pathlib import PureWindowsPath
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+import tool_runner
+from audio_encoder import encoder_args
+from pcm_io import SAMPLE_RATE, to_pcm16
+from workspace import Workspace
+
+# Default MKVToolNix installation folder on Windows, which is usually not on the PATH
+MKVTOOLNIX_WINDOWS_DIR = PureWindowsPath(r"C:\Program Files\MKVToolNix")
+
+def find_mkvtoolnix(tool: str) -> str:
+    """Path of an MKVToolNix tool: the one on the PATH, else the default Windows installation"""
+    return shutil.which(tool) or str(MKVTOOLNIX_WINDOWS_DIR / f"{tool}.exe")
 
 class MediaProcessor:
-    def __init__(self):
-        # Default MKVToolNix installation path
-        self.mkvmerge = r"C:\Program Files\MKVToolNix\mkvmerge.exe"
-        self.mkvextract = r"C:\Program Files\MKVToolNix\mkvextract.exe"
-        self._verify_mkvtoolnix()
+    # Tool checks already done in this process; a long-running server only checks once
+    _verified_tools = set()
+    
+    def __init__(self, workspace: Optional[Workspace] = None):
+        self.mkvmerge = find_mkvtoolnix('mkvmerge')
+        self.mkvextract = find_mkvtoolnix('mkvextract')
+        self.has_mkvtoolnix = self._verify_mkvtoolnix()
         
-        # Create temp directory with a short path to avoid Windows path length limitations
-        temp_base = os.environ.get('TEMP', tempfile.gettempdir())
-        short_dir_name = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
-        self.temp_dir = Path(temp_base) / short_dir_name
-        self.temp_dir.mkdir(exist_ok=True)
+        self.workspace = workspace or Workspace()
+        self._owns_workspace = workspace is None
         
-    def _verify_mkvtoolnix(self):
+    def _verify_mkvtoolnix(self) -> bool:
+        """Whether MKVToolNix can be run; without it outputs are written with ffmpeg"""
+        if self.mkvmerge in MediaProcessor._verified_tools:
+            return True
         try:
-            result = subprocess.run([self.mkvmerge, '--version'], capture_output=True, text=True)
+            result = tool_runner.run([self.mkvmerge, '--version'], timeout=30, check=False,
+                                     capture_output=True, text=True)
             print(f"MKVMerge version: {result.stdout.splitlines()[0]}")
-        except FileNotFoundError:
-            raise RuntimeError(f"MKVToolNix not found at {self.mkvmerge}. Please install MKVToolNix first.")
+            MediaProcessor._verified_tools.add(self.mkvmerge)
+            return True
+        except OSError:
+            print(f"Note: MKVToolNix not found at {self.mkvmerge}; outputs are written with ffmpeg, "
+                  f"and subtitles cannot be extracted from the video")
+            return False
 
     def extract_subtitles(self, video_path: Path, language_code: str) -> tuple[Optional[Path], list[str]]:
         """Extract subtitles of a specified language from an MKV file
@@ -36,13 +55,16 @@ class MediaProcessor:
                 - available_languages: List of available subtitle language codes
         """
         print(f"Extracting {language_code} subtitles from {video_path}")
+        if not self.has_mkvtoolnix:
+            raise RuntimeError("Extracting subtitles from the video needs MKVToolNix; "
+                               "install it or pass the subtitles as an .srt file")
         
         # First, get info about tracks in the MKV file
         cmd = [self.mkvmerge, '-J', str(video_path)]
         available_subtitles = []
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = tool_runner.run(cmd, timeout=120, capture_output=True, text=True)
             import json
             info = json.loads(result.stdout)
             
@@ -77,13 +99,14 @@ class MediaProcessor:
                     return None, []
             
             # Extract the subtitle track to a temporary SRT file
-            temp_srt = self.temp_dir / f"subtitles_{language_code}.srt"
+            temp_srt = self.workspace.path(f"subtitles_{language_code}.srt")
             extract_cmd = [
                 self.mkvextract, 'tracks', str(video_path),
                 f"{subtitle_track_id}:{str(temp_srt)}"
             ]
             
-            subprocess.run(extract_cmd, check=True)
+            tool_runner.run(extract_cmd)
+            self.workspace.commit(temp_srt)
             
             if temp_srt.exists():
                 print(f"Successfully extracted subtitles to {temp_srt}")
@@ -92,8 +115,8 @@ class MediaProcessor:
                 print(f"Failed to extract subtitles to {temp_srt}")
                 return None, available_subtitles
                 
-        except subprocess.CalledProcessError as e:
-            print(f"Error executing mkvmerge to get track info: {e}")
+        except subprocess.SubprocessError as e:
+            print(f"Error reading or extracting subtitle tracks: {e}")
             return None, []
         except Exception as e:
             print(f"Error extracting subtitles: {e}")
@@ -122,35 +145,39 @@ class MediaProcessor:
         # If we get here, we need to copy the file to a temp location
         file_ext = video_path.suffix
         short_name = f"input{file_ext}"
-        temp_video = self.temp_dir / short_name
+        # Videos are large, so the size hint normally keeps the copy on disk
+        temp_video = self.workspace.path(short_name, size_hint=video_path.stat().st_size)
         
         # For large files, use ffmpeg to copy instead of shutil to avoid loading into memory
         print(f"Copying video to temp location: {temp_video}")
         try:
-            subprocess.run([
+            tool_runner.run([
                 'ffmpeg', '-i', str(video_path), 
                 '-c', 'copy', '-y', str(temp_video)
-            ], check=True)
+            ])
             
+            self.workspace.commit(temp_video)
             return temp_video
-        except subprocess.CalledProcessError as e:
+        except tool_runner.ToolError as e:
             print(f"Error copying video with ffmpeg: {e}")
             print("Trying alternative copy method...")
             
             # Try again with a more specific approach - just copy the video stream
             try:
-                subprocess.run([
+                tool_runner.run([
                     'ffmpeg', '-i', str(video_path),
                     '-map', '0:v',  # Just the video stream
                     '-c:v', 'copy',
                     '-y', str(temp_video)
-                ], check=True)
+                ])
                 
+                self.workspace.commit(temp_video)
                 return temp_video
-            except subprocess.CalledProcessError as e2:
+            except tool_runner.ToolError as e2:
                 print(f"Alternative copy also failed: {e2}")
                 # Last resort: try direct file copy
                 shutil.copy2(video_path, temp_video)
+                self.workspace.commit(temp_video)
                 return temp_video
 
     def save_video(self, video_path: Path, dubbed_audio: Path, output_path: str, language: str = 'et'):
@@ -164,7 +191,8 @@ class MediaProcessor:
         
         # If path is too long, use a temporary output path
         if use_temp:
-            temp_output = self.temp_dir / f"output_{int(time.time())}.mkv"
+            temp_output = self.workspace.path(f"output_{int(time.time())}.mkv",
+                                              size_hint=Path(video_path).stat().st_size)
         else:
             temp_output = Path(output_path)
         
@@ -188,19 +216,22 @@ class MediaProcessor:
                 str(dubbed_audio)
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            print("\nMKVMerge output:")
-            print(result.stdout)
-            if result.stderr:
-                print("\nMKVMerge errors:")
-                print(result.stderr)
-            
+            result = tool_runner.run(cmd, check=False, capture_output=True, text=True)
             if result.returncode != 0:
+                # mkvmerge reports its errors on stdout
+                print("\nMKVMerge output:")
+                print(result.stdout[-4000:])
+                if result.stderr:
+                    print("\nMKVMerge errors:")
+                    print(result.stderr)
                 raise RuntimeError(f"MKVMerge failed with return code {result.returncode}")
             
             if not temp_output.exists():
                 raise RuntimeError("Output file was not created")
             
+        except tool_runner.ToolTimeout:
+            # A full-file retry would only run into the same timeout
+            raise
         except Exception as e:
             print(f"\nError during MKVMerge: {str(e)}")
             print("Trying ffmpeg fallback...")
@@ -224,12 +255,12 @@ class MediaProcessor:
                     str(temp_output)
                 ]
                 
-                subprocess.run(ffmpeg_cmd, check=True)
+                tool_runner.run(ffmpeg_cmd)
                 
                 if not temp_output.exists():
                     raise RuntimeError("Output file was not created with ffmpeg")
                 
-            except subprocess.CalledProcessError as e:
+            except tool_runner.ToolError as e:
                 print(f"FFmpeg fallback failed: {e}")
                 print("Trying simpler ffmpeg approach...")
                 
@@ -247,32 +278,170 @@ class MediaProcessor:
                         str(temp_output)
                     ]
                     
-                    subprocess.run(simple_cmd, check=True)
+                    tool_runner.run(simple_cmd)
                     
+                except tool_runner.ToolTimeout:
+                    raise
                 except Exception as e:
                     print(f"All merge attempts failed: {e}")
                     raise RuntimeError("Could not create output file with any method")
         
         # If we used a temporary path due to length, copy to the final destination
         if use_temp and temp_output.exists():
+            self.workspace.commit(temp_output)
             print(f"Copying final output to: {output_path}")
             # Use ffmpeg to copy to final destination to handle long paths better
             try:
-                subprocess.run([
+                tool_runner.run([
                     'ffmpeg', '-i', str(temp_output),
                     '-c', 'copy', '-y', output_path
-                ], check=True)
+                ])
+                self.workspace.release(temp_output)
             except Exception as e:
                 print(f"Error copying to final destination: {e}")
+                # Move the output out of the workspace so cleanup does not delete it
+                rescued_output = Path(os.environ.get('TEMP', tempfile.gettempdir())) / temp_output.name
+                shutil.move(str(temp_output), str(rescued_output))
+                temp_output = rescued_output
                 print(f"Final output is available at: {temp_output}")
         
         print(f"Successfully created: {output_path if not use_temp or (use_temp and Path(output_path).exists()) else temp_output}")
 
-    def cleanup(self):
+    def mux_stream(self, video_path: Path, blocks: Iterable[np.ndarray], output_path: str,
+                   language: str = 'et', channels: int = 2, sidecar: bool = False, codec: str = 'ac3',
+                   layout: Optional[str] = None) -> str:
+        """Encode mixed PCM blocks and mux them with the source streams in one pass.
+
+        The blocks are written to ffmpeg's stdin as they are produced, so no
+        intermediate audio file is written. Video, original audio and (for
+        Matroska sources) subtitles and attachments are stream-copied. With
+        `sidecar` only the dubbed track is written, to a .mka file.
+        """
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            # Input 0: the mixed audio on stdin
+            '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', str(channels), '-i', 'pipe:0'
+        ]
+        if sidecar:
+            output_path = str(Path(output_path).with_suffix('.mka'))
+            cmd.extend(['-map', '0:a'])
+        else:
+            output_path = str(Path(output_path).with_suffix('.mkv'))
+            cmd.extend([
+                # Input 1: the source video
+                '-i', str(video_path),
+                '-map', '1:v?',
+                '-map', '0:a',  # Dubbed audio first, so it is the first audio track
+                '-map', '1:a?'
+            ])
+            if Path(video_path).suffix.lower() == '.mkv':
+                cmd.extend(['-map', '1:s?', '-map', '1:t?'])
+        cmd.extend(['-c', 'copy'] + encoder_args(codec, 'a:0', channels, layout) + [
+            '-metadata:s:a:0', f'title=AI Dubbed Audio ({language})',
+            '-metadata:s:a:0', f'language={language}',
+            '-disposition:a:0', 'default',
+            output_path
+        ])
+        
+        start_time = time.time()
+        self._feed_encoder(cmd, blocks, output_path)
+        print(f"Streaming mix, encode and mux took {time.time() - start_time:.2f} seconds")
+        print(f"Successfully created: {output_path}")
+        return output_path
+
+    def mux_preview(self, video_path: Path, blocks: Iterable[np.ndarray], output_path: str,
+                    windows: List[Tuple[float, float]], language: str = 'et', channels: int = 2,
+                    sidecar: bool = False, codec: str = 'ac3', layout: Optional[str] = None) -> str:
+        """Write a preview clip of the given time windows, played back to back.
+
+        `blocks` is the mix of the windows in the same order. With `sidecar`
+        only the dubbed audio is written; otherwise the video of each window
+        is cut with input seeking, joined and re-encoded (cheap for a short
+        clip, and frame-accurate unlike a stream copy).
+        """
+        if sidecar:
+            return self.mux_stream(video_path, blocks, output_path, language=language,
+                                   channels=channels, sidecar=True, codec=codec, layout=layout)
+        
+        output_path = str(Path(output_path).with_suffix('.mkv'))
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', str(channels), '-i', 'pipe:0'
+        ]
+        for start, end in windows:
+            cmd.extend(['-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', str(video_path)])
+        video_inputs = ''.join(f"[{index + 1}:v:0]" for index in range(len(windows)))
+        cmd.extend([
+            '-filter_complex', f"{video_inputs}concat=n={len(windows)}:v=1:a=0[video]",
+            '-map', '[video]',
+            '-map', '0:a',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23'
+        ] + encoder_args(codec, 'a:0', channels, layout) + [
+            '-metadata:s:a:0', f'title=AI Dubbed Audio ({language})',
+            '-metadata:s:a:0', f'language={language}',
+            output_path
+        ])
+        
+        start_time = time.time()
+        self._feed_encoder(cmd, blocks, output_path)
+        print(f"Preview of {len(windows)} window(s) took {time.time() - start_time:.2f} seconds")
+        print(f"Successfully created: {output_path}")
+        return output_path
+
+    def _feed_encoder(self, cmd: List[str], blocks: Iterable[np.ndarray], output_path: str):
+        """Run an ffmpeg command that reads s16le PCM on stdin and write the blocks to it"""
+        encoder = tool_runner.start(cmd, stdin=subprocess.PIPE)
         try:
-            shutil.rmtree(self.temp_dir)
-        except Exception as e:
-            print(f"Warning: Could not clean up temp dir {self.temp_dir}: {e}")
+            for block in blocks:
+                encoder.stdin.write(to_pcm16(block).tobytes())
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its return code tells why
+        except BaseException:
+            encoder.kill()
+            encoder.wait()
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            raise
+        encoder.wait(check=True)
+
+    def save_sidecar(self, dubbed_audio: Path, output_path: str, language: str = 'et') -> str:
+        """Write only the dubbed track to a standalone .mka file with language and title tags"""
+        output_path = str(Path(output_path).with_suffix('.mka'))
+        cmd = [
+            self.mkvmerge,
+            '-o', output_path,
+            '--track-name', f'0:AI Dubbed Audio ({language})',
+            '--language', f'0:{language}',
+            '--default-track', '0:yes',
+            str(dubbed_audio)
+        ]
+        try:
+            result = tool_runner.run(cmd, check=False, capture_output=True, text=True)
+            error = None
+            if result.returncode != 0 or not os.path.exists(output_path):
+                error = f"MKVMerge failed ({result.returncode})\n{result.stdout[-4000:]}{result.stderr}"
+        except OSError as e:
+            # MKVToolNix is not installed (FileNotFoundError) or cannot be started
+            error = f"Could not run MKVMerge: {e}"
+        if error is not None:
+            print(error)
+            print("Trying ffmpeg fallback...")
+            tool_runner.run([
+                'ffmpeg', '-y',
+                '-i', str(dubbed_audio),
+                '-map', '0:a',
+                '-c', 'copy',
+                '-metadata:s:a:0', f'title=AI Dubbed Audio ({language})',
+                '-metadata:s:a:0', f'language={language}',
+                output_path
+            ])
+        print(f"Successfully created: {output_path}")
+        return output_path
+
+    def cleanup(self):
+        if self._owns_workspace:
+            self.workspace.cleanup()
 
     # Alternative method for quick testing
     def quick_test_merge(self, video_path: str, aac_audio_path: str, output_path: str):
@@ -290,5 +459,5 @@ class MediaProcessor:
             '--default-track', '0:yes',
             str(aac_audio_path)
         ]
-        subprocess.run(cmd, check=True)
+        tool_runner.run(cmd)
         print(f"Quick test merge completed: {output_path}") 
\ No newline at end of file
@@ -0,0 +1,109 @@
+import wave
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Sample rate used for all intermediate PCM
+SAMPLE_RATE = 48000
+
+# Channel order of the common ffmpeg channel layouts (as reported by ffprobe)
+CHANNEL_LAYOUTS = {
+    'mono': ['FC'],
+    'stereo': ['FL', 'FR'],
+    '2.1': ['FL', 'FR', 'LFE'],
+    '3.0': ['FL', 'FR', 'FC'],
+    '3.0(back)': ['FL', 'FR', 'BC'],
+    '3.1': ['FL', 'FR', 'FC', 'LFE'],
+    '4.0': ['FL', 'FR', 'FC', 'BC'],
+    'quad': ['FL', 'FR', 'BL', 'BR'],
+    'quad(side)': ['FL', 'FR', 'SL', 'SR'],
+    '4.1': ['FL', 'FR', 'FC', 'LFE', 'BC'],
+    '5.0': ['FL', 'FR', 'FC', 'BL', 'BR'],
+    '5.0(side)': ['FL', 'FR', 'FC', 'SL', 'SR'],
+    '5.1': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR'],
+    '5.1(side)': ['FL', 'FR', 'FC', 'LFE', 'SL', 'SR'],
+    '6.0': ['FL', 'FR', 'FC', 'BC', 'SL', 'SR'],
+    '6.1': ['FL', 'FR', 'FC', 'LFE', 'BC', 'SL', 'SR'],
+    '7.0': ['FL', 'FR', 'FC', 'BL', 'BR', 'SL', 'SR'],
+    '7.1': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'SL', 'SR'],
+    '7.1(wide)': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'FLC', 'FRC'],
+    '7.1(wide-side)': ['FL', 'FR', 'FC', 'LFE', 'FLC', 'FRC', 'SL', 'SR'],
+}
+
+# Layout assumed for a channel count when the source does not name one
+DEFAULT_LAYOUTS = {1: 'mono', 2: 'stereo', 6: '5.1', 8: '7.1'}
+
+def channel_names(layout: Optional[str], channels: int) -> Optional[List[str]]:
+    """Names of the channels in order (FL, FR, FC, ...), or None for an unknown layout"""
+    names = CHANNEL_LAYOUTS.get(layout or DEFAULT_LAYOUTS.get(channels, ''))
+    return names if names is not None and len(names) == channels else None
+
+def read_wav(path: Path) -> Tuple[np.ndarray, int]:
+    """Read a 16-bit PCM WAV file as float32 samples of shape (frames, channels)"""
+    with wave.open(str(path), 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path} is not 16-bit PCM")
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    samples = np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+    return samples.astype(np.float32) / 32768.0, sample_rate
+
+def to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """Convert float samples to clipped little-endian int16"""
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768.0).astype('<i2')
+
+def write_wav(path: Path, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    """Write float32 samples of shape (frames, channels) as a 16-bit PCM WAV file"""
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(to_pcm16(samples).tobytes())
+
+def wav_duration(path: Path) -> float:
+    """Duration of a WAV file in seconds, read from its header"""
+    with wave.open(str(path), 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+class WavReader:
+    """Streams a 16-bit WAV file through the decoder interface of tool_runner.ToolProcess.
+
+    Used in place of an ffmpeg decoder when a source is already raw PCM:
+    stdout.read() returns interleaved int16 frames of [start_frame, end_frame).
+    """
+
+    def __init__(self, path: Path, start_frame: int = 0, end_frame: Optional[int] = None):
+        self._wav = wave.open(str(path), 'rb')
+        if self._wav.getsampwidth() != 2:
+            self._wav.close()
+            raise ValueError(f"{path} is not 16-bit PCM")
+        self.channels = self._wav.getnchannels()
+        self.sample_rate = self._wav.getframerate()
+        self._frame_bytes = self.channels * 2
+        total = self._wav.getnframes()
+        self._wav.setpos(min(start_frame, total))
+        self._remaining = max(0, min(total, end_frame if end_frame is not None else total) - start_frame)
+        self.stdout = self
+        self.stderr_tail = ''
+
+    def read(self, size: int) -> bytes:
+        frames = min(size // self._frame_bytes, self._remaining)
+        self._remaining -= frames
+        return self._wav.readframes(frames) if frames else b''
+
+    def wait(self, check: bool = False) -> int:
+        self._wav.close()
+        return 0
+
+    def check(self):
+        pass
+
+    def poll(self) -> int:
+        return 0
+
+    def kill(self):
+        self._wav.close()
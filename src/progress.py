@@ -0,0 +1,167 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Throughput for the ETA is measured over this many recent seconds
+THROUGHPUT_WINDOW_SECONDS = 30.0
+
+class JsonLinesSink:
+    """Writes each progress event as one JSON line to a file descriptor or socket.
+
+    A socket address is a Unix socket path or host:port. If the reader goes
+    away the sink disables itself; progress reporting never fails a job.
+    """
+
+    def __init__(self, fd: Optional[int] = None, address: Optional[str] = None):
+        self._socket = None
+        self._file = None
+        if fd is not None:
+            self._file = os.fdopen(fd, 'w', buffering=1, encoding='utf-8', closefd=False)
+        elif address is not None:
+            host, _, port = address.rpartition(':')
+            if host and port.isdigit():
+                self._socket = socket.create_connection((host, int(port)))
+            else:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(address)
+        else:
+            raise ValueError("JsonLinesSink needs a file descriptor or a socket address")
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                if self._socket is not None:
+                    self._socket.sendall(line.encode('utf-8'))
+                elif self._file is not None:
+                    self._file.write(line)
+            except (OSError, ValueError) as e:
+                print(f"Progress sink closed ({e}); no more progress events will be written")
+                self.close()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+class ProgressReporter:
+    """Emits progress events to callbacks (e.g. a JsonLinesSink).
+
+    Events are dicts with an 'event' key:
+      stage_start  stage, total, unit
+      progress     stage, done, total, unit, bytes, rate (units/s), eta_seconds, and item/ok for lines
+      stage_end    stage, seconds, done, bytes
+      job_end      status, output or error
+    Every event carries 'time' (Unix seconds) and, if set, 'job'. Reporting
+    a unit of work is a few dict operations plus the callbacks, so it can be
+    done per line.
+    """
+
+    def __init__(self, callbacks: Optional[List[Callable[[dict], None]]] = None, job_id: Optional[str] = None):
+        self.callbacks = list(callbacks or [])
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._stage = None
+        self._stage_started = 0.0
+        self._total = None
+        self._unit = None
+        self._done = 0
+        self._bytes = 0
+        self._samples = deque()  # (time, done) for the rolling throughput
+
+    @property
+    def active(self) -> bool:
+        return bool(self.callbacks)
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        self.callbacks.append(callback)
+
+    def emit(self, event: str, **fields):
+        if not self.callbacks:
+            return
+        payload = {'event': event, 'time': time.time()}
+        if self.job_id is not None:
+            payload['job'] = self.job_id
+        payload.update(fields)
+        for callback in self.callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+
+    def stage_start(self, stage: str, total: Optional[float] = None, unit: Optional[str] = None):
+        with self._lock:
+            self._stage = stage
+            self._stage_started = time.time()
+            self._total = total
+            self._unit = unit
+            self._done = 0
+            self._bytes = 0
+            self._samples = deque([(self._stage_started, 0)])
+        self.emit('stage_start', stage=stage, total=total, unit=unit)
+
+    def set_total(self, total: float, unit: Optional[str] = None):
+        """Set the amount of work of the current stage once it is known"""
+        with self._lock:
+            self._total = total
+            if unit is not None:
+                self._unit = unit
+
+    def advance(self, count: float = 1, nbytes: int = 0, item: Optional[int] = None, ok: Optional[bool] = None):
+        """Record `count` finished units (and `nbytes` processed) of the current stage"""
+        if not self.callbacks:
+            return
+        with self._lock:
+            now = time.time()
+            self._done += count
+            self._bytes += nbytes
+            samples = self._samples
+            samples.append((now, self._done))
+            while len(samples) > 2 and now - samples[1][0] > THROUGHPUT_WINDOW_SECONDS:
+                samples.popleft()
+            elapsed = now - samples[0][0]
+            rate = (self._done - samples[0][1]) / elapsed if elapsed > 0 else None
+            eta = None
+            if rate and self._total is not None:
+                eta = max(0.0, (self._total - self._done) / rate)
+            fields = {
+                'stage': self._stage, 'done': self._done, 'total': self._total, 'unit': self._unit,
+                'bytes': self._bytes, 'rate': rate, 'eta_seconds': eta
+            }
+        if item is not None:
+            fields['item'] = item
+        if ok is not None:
+            fields['ok'] = ok
+        self.emit('progress', **fields)
+
+    def stage_end(self, stage: str):
+        with self._lock:
+            seconds = time.time() - self._stage_started if self._stage == stage else None
+            done, nbytes = self._done, self._bytes
+            if self._stage == stage:
+                self._stage = None
+        self.emit('stage_end', stage=stage, seconds=seconds, done=done, bytes=nbytes)
+
+    def track_blocks(self, blocks: Iterable[np.ndarray], sample_rate: int) -> Iterator[np.ndarray]:
+        """Pass PCM blocks through, reporting the seconds of audio and PCM bytes of each"""
+        for block in blocks:
+            yield block
+            self.advance(len(block) / sample_rate, nbytes=block.size * 2)
+
+    def close(self):
+        for callback in self.callbacks:
+            if hasattr(callback, 'close'):
+                callback.close()
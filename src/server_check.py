@@ -0,0 +1,157 @@
+"""Smoke check for the dubbing server in Unix-socket mode.
+
+Starts the local TTS stand-in and `dub_server.py --socket` in a separate
+process, submits a sidecar job for a short generated video and SRT over
+the socket and waits for it. The job must end as 'done', and its sidecar
+must hold one audio track tagged with the job's language and lasting at
+least as long as the video.
+
+    python src/server_check.py    # exit code 1 on failure
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import tool_runner
+from tts_standin_server import StandInTTSServer
+from workspace import Workspace
+
+VIDEO_SECONDS = 6.0
+SUBTITLES = """1
+00:00:01,000 --> 00:00:02,500
+Tere tulemast.
+
+2
+00:00:03,500 --> 00:00:05,000
+Head aega.
+"""
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def request(socket_path: str, method: str, path: str, payload: dict = None) -> tuple:
+    """Send one request to the server and return (status, decoded JSON body)"""
+    connection = UnixHTTPConnection(socket_path)
+    try:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def make_fixtures(workspace: Workspace) -> tuple:
+    """A short video with a stereo tone and an SRT with two cues"""
+    video_path = workspace.path('check_video.mkv')
+    tool_runner.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc=size=160x90:rate=10:duration={VIDEO_SECONDS}',
+        '-f', 'lavfi', '-i', f'sine=frequency=220:sample_rate=48000:duration={VIDEO_SECONDS}',
+        '-map', '0:v', '-map', '1:a', '-c:v', 'mpeg4', '-c:a', 'flac', '-ac', '2',
+        str(video_path)
+    ])
+    workspace.commit(video_path)
+    subtitle_path = workspace.path('check_subtitles.srt')
+    subtitle_path.write_text(SUBTITLES, encoding='utf-8')
+    workspace.commit(subtitle_path)
+    return video_path, subtitle_path
+
+def wait_for_job(socket_path: str, job_id: str, timeout: float) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        _, job = request(socket_path, 'GET', f'/jobs/{job_id}')
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.5)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout:.0f} seconds")
+
+def check_output(output_path: Path, language: str) -> list:
+    if not output_path.exists():
+        return [f"{output_path} was not written"]
+    probe = json.loads(tool_runner.run([
+        'ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type:stream_tags=language:format=duration',
+        '-of', 'json', str(output_path)
+    ], capture_output=True, text=True).stdout)
+    failures = []
+    streams = probe.get('streams', [])
+    if [stream['codec_type'] for stream in streams] != ['audio']:
+        failures.append(f"expected one audio track, found {[stream['codec_type'] for stream in streams]}")
+    elif streams[0].get('tags', {}).get('language') != language:
+        failures.append(f"audio track is tagged {streams[0].get('tags', {}).get('language')!r}, not {language!r}")
+    duration = float(probe.get('format', {}).get('duration', 0.0))
+    # The track runs on past the video when the last voiceover does
+    if duration < VIDEO_SECONDS - 0.1:
+        failures.append(f"sidecar lasts {duration:.3f} seconds, the video {VIDEO_SECONDS:g}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Smoke check: run one job through the dubbing server')
+    parser.add_argument('--timeout', type=float, default=300.0, help='Seconds to wait for the job (default: %(default)s)')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    workspace = Workspace(prefer_memory=False)
+    socket_path = str(workspace.disk_dir / 'server.sock')
+    failures = []
+    server = None
+    try:
+        video_path, subtitle_path = make_fixtures(workspace)
+        output_path = workspace.disk_dir / 'check_output.mka'
+        with StandInTTSServer() as tts:
+            server = subprocess.Popen([
+                sys.executable, str(Path(__file__).with_name('dub_server.py')),
+                '--socket', socket_path, '--tts-endpoint', tts.url, '--no-shm'
+            ])
+            deadline = time.time() + 60
+            while not os.path.exists(socket_path):
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"Server did not start listening on {socket_path}")
+                time.sleep(0.2)
+
+            status, job = request(socket_path, 'POST', '/jobs', {
+                'video_path': str(video_path), 'subtitle_path': str(subtitle_path),
+                'output_path': str(output_path), 'language': 'et', 'output_mode': 'sidecar'
+            })
+            if status != 202:
+                raise RuntimeError(f"Job was not accepted ({status}): {job}")
+            job = wait_for_job(socket_path, job['id'], args.timeout)
+            print(f"Job {job['id']}: {job['status']} in {job['finished_at'] - job['started_at']:.2f} seconds")
+            if job['status'] != 'done':
+                failures.append(f"job {job['status']}: {job['error']}")
+            else:
+                failures += check_output(output_path, 'et')
+            if tts.request_count == 0:
+                failures.append("the server never reached the TTS stand-in")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+        workspace.cleanup()
+
+    print(f"Checked in {time.perf_counter() - start_time:.2f} seconds")
+    if failures:
+        print("Server check FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("Server check passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+from dataclasses import asdict
+from typing import Dict, Optional
+
+from clip_conditioner import ClipConditioner
+from tts_engine import TTSEngine, synthesize_cue
+from tts_transport import PooledTransport, DEFAULT_POOL_SIZE
+from work_queue import DirectoryWorkQueue, Shard, ShardResult, WorkQueue, default_worker_name
+from workspace import Workspace
+
+class ShardWorker:
+    """Claims synthesis shards from a work queue and writes the clips back as artifacts"""
+
+    def __init__(self, work_queue: WorkQueue, name: Optional[str] = None,
+                 tts_endpoint: Optional[str] = None, tts_pool_size: int = DEFAULT_POOL_SIZE):
+        self.work_queue = work_queue
+        self.name = name or default_worker_name()
+        self.workspace = Workspace()
+        self.transport = PooledTransport(endpoint=tts_endpoint, pool_size=tts_pool_size)
+        self.engines: Dict[str, TTSEngine] = {}
+        self.clip_conditioner = ClipConditioner()
+
+    def _engine(self, language: str) -> TTSEngine:
+        if language not in self.engines:
+            self.engines[language] = TTSEngine(language, self.workspace, self.transport)
+        return self.engines[language]
+
+    def process_shard(self, shard: Shard) -> ShardResult:
+        engine = self._engine(shard.language)
+        clip_dir = self.work_queue.artifact_dir(shard.job_id)
+        result = ShardResult(shard_id=shard.shard_id, worker=self.name)
+        for line in shard.lines:
+            try:
+                clip = synthesize_cue(engine, self.clip_conditioner, line['text'],
+                                      line['start_time'], line['end_time'], speed=shard.speed)
+                clip_path = clip_dir / f"{shard.shard_id}_{line['index']}.wav"
+                # A worker that lost its lease may still be writing the same clip; readers
+                # only ever see one complete file
+                temp_path = clip_dir / f".{clip_path.name}.{shard.lease_id}.tmp"
+                shutil.copyfile(clip.path, temp_path)
+                os.replace(temp_path, clip_path)
+                self.workspace.release(clip.path)
+                clip.path = str(clip_path)
+                result.clips.append(asdict(clip))
+            except Exception as e:
+                print(f"Error processing subtitle {line['index']}: {str(e)}")
+                result.failed_lines.append(line['index'])
+        return result
+
+    def run(self, idle_exit: Optional[float] = None, poll_interval: float = 1.0):
+        """Process shards until stopped, or until idle for idle_exit seconds"""
+        print(f"Worker {self.name} started")
+        idle_since = time.time()
+        try:
+            while True:
+                shard = self.work_queue.claim(self.name)
+                if shard is None:
+                    if idle_exit is not None and time.time() - idle_since > idle_exit:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                print(f"Worker {self.name} claimed shard {shard.shard_id} ({len(shard.lines)} lines)")
+                # Keep the lease alive while the shard is being synthesized
+                done = threading.Event()
+                heartbeat_interval = getattr(self.work_queue, 'lease_seconds', 30.0) / 3
+                def heartbeat():
+                    while not done.wait(heartbeat_interval):
+                        if not self.work_queue.renew(shard):
+                            print(f"Worker {self.name} lost the lease on shard {shard.shard_id}")
+                            break
+                heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+                heartbeat_thread.start()
+                try:
+                    result = self.process_shard(shard)
+                    if result.clips or not shard.lines:
+                        self.work_queue.complete(shard, result)
+                    else:
+                        self.work_queue.fail(shard, 'no line of the shard could be synthesized')
+                except Exception as e:
+                    traceback.print_exc()
+                    self.work_queue.fail(shard, str(e))
+                finally:
+                    done.set()
+                    heartbeat_thread.join()
+                idle_since = time.time()
+        finally:
+            self.transport.close()
+            self.workspace.cleanup()
+
+def _run_worker(queue_dir: str, lease_seconds: float, idle_exit: Optional[float],
+                tts_endpoint: Optional[str], tts_pool_size: int):
+    work_queue = DirectoryWorkQueue(queue_dir, lease_seconds=lease_seconds)
+    ShardWorker(work_queue, tts_endpoint=tts_endpoint, tts_pool_size=tts_pool_size).run(idle_exit=idle_exit)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Synthesis worker for sharded dubbing jobs')
+    parser.add_argument('queue_dir', help='Shared work queue directory (same as --queue-dir of main.py)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='Worker processes on this node (default: %(default)s)')
+    parser.add_argument('--lease', type=float, default=120.0, help='Shard lease in seconds (default: %(default)s)')
+    parser.add_argument('--idle-exit', type=float, help='Exit after this many seconds without work')
+    parser.add_argument('--tts-endpoint', help='Send gTTS requests to this base URL instead of Google')
+    parser.add_argument('--tts-pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='Keep-alive connections per worker process (default: %(default)s)')
+    args = parser.parse_args()
+
+    worker_args = (args.queue_dir, args.lease, args.idle_exit, args.tts_endpoint, args.tts_pool_size)
+    processes = [multiprocessing.Process(target=_run_worker, args=worker_args) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import tool_runner
+from pcm_io import WavReader
+from progress import ProgressReporter
+
+# The source is analyzed as mono at this rate, in 25 ms frames and 1 s intervals
+ANALYSIS_RATE = 16000
+FRAME_SAMPLES = 400
+FRAMES_PER_INTERVAL = 40
+INTERVAL_SECONDS = FRAME_SAMPLES * FRAMES_PER_INTERVAL / ANALYSIS_RATE
+
+# Intervals decoded and analyzed per block; memory does not grow with the source length
+BLOCK_INTERVALS = 30
+
+# Spectral flatness is measured over the band that carries speech
+FLATNESS_BAND_HZ = (100.0, 4000.0)
+
+# Intervals quieter than this are silence, whatever their content
+SILENCE_DB = -50.0
+
+# A frame is a low-energy frame below this fraction of its interval's mean power.
+# Speech alternates syllables and pauses, so many of its frames are low-energy,
+# and between pauses its spectrum swings between voiced (tonal) and unvoiced
+# (noisy) frames; music and steady effects do neither. Either measure at its
+# value here scores 0.5. Calibrated on the labelled fixtures of golden_audio.py:
+# speech, also over a music bed, has 0.55-0.7 low-energy frames (score >= 0.6),
+# sustained music and drums under 0.2, and staccato piano about 0.4.
+LOW_ENERGY_FRACTION = 0.5
+SPEECH_LOW_ENERGY_RATIO = 0.45
+SPEECH_FLATNESS_SPREAD = 0.1
+
+LABELS = ('unknown', 'silence', 'speech', 'music')
+
+@dataclass
+class SourceAnalysis:
+    """Per-interval features and labels of a source track.
+
+    Intervals outside the analyzed windows are labelled 'unknown'.
+    """
+    energy_db: np.ndarray      # mean power of each interval, in dBFS
+    flatness: np.ndarray       # mean spectral flatness (0 tonal .. 1 noise)
+    speech_score: np.ndarray   # 0 (music-like) .. 1 (speech-like)
+    labels: np.ndarray         # indices into LABELS
+    interval_seconds: float = INTERVAL_SECONDS
+
+    def label(self, start: float, end: float) -> Optional[str]:
+        """The most common label of the analyzed intervals overlapping [start, end), or None"""
+        first = max(0, int(start / self.interval_seconds))
+        last = min(len(self.labels), int(np.ceil(end / self.interval_seconds)))
+        counts = np.bincount(self.labels[first:last], minlength=len(LABELS))
+        counts[0] = 0
+        if not counts.any():
+            return None
+        return LABELS[int(np.argmax(counts))]
+
+    def summary(self) -> Dict[str, float]:
+        """Seconds of source audio per label"""
+        counts = np.bincount(self.labels, minlength=len(LABELS))
+        return {name: float(count * self.interval_seconds) for name, count in zip(LABELS, counts) if count}
+
+def _frame_features(frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Power and spectral flatness of each frame; frames has shape (n, FRAME_SAMPLES)"""
+    power = np.mean(np.square(frames), axis=1)
+    spectrum = np.fft.rfft(frames * np.hanning(FRAME_SAMPLES).astype(np.float32), axis=1)
+    bin_hz = ANALYSIS_RATE / FRAME_SAMPLES
+    band = spectrum[:, int(FLATNESS_BAND_HZ[0] / bin_hz):int(FLATNESS_BAND_HZ[1] / bin_hz) + 1]
+    band_power = np.square(band.real) + np.square(band.imag) + 1e-12
+    flatness = np.exp(np.mean(np.log(band_power), axis=1)) / np.mean(band_power, axis=1)
+    return power, flatness
+
+def analyze_intervals(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Features and labels of whole intervals of mono ANALYSIS_RATE samples, in one vectorized pass"""
+    intervals = len(samples) // (FRAME_SAMPLES * FRAMES_PER_INTERVAL)
+    frames = samples[:intervals * FRAME_SAMPLES * FRAMES_PER_INTERVAL].reshape(-1, FRAME_SAMPLES)
+    power, flatness = _frame_features(frames)
+    power = power.reshape(intervals, FRAMES_PER_INTERVAL)
+    flatness = flatness.reshape(intervals, FRAMES_PER_INTERVAL)
+
+    mean_power = np.mean(power, axis=1)
+    energy_db = 10 * np.log10(mean_power + 1e-12)
+    low_energy = power < LOW_ENERGY_FRACTION * mean_power[:, np.newaxis]
+    low_energy_ratio = np.mean(low_energy, axis=1)
+    # Spread of the flatness over the frames that are not low-energy
+    active = ~low_energy
+    active_frames = np.maximum(np.sum(active, axis=1), 1)
+    active_mean = np.sum(flatness * active, axis=1) / active_frames
+    flatness_spread = np.sqrt(np.sum(np.square(flatness - active_mean[:, np.newaxis]) * active, axis=1) / active_frames)
+    # Unvoiced frames are often quiet enough to count as low-energy, so the flatness
+    # spread can stay small in speech; either measure alone is evidence
+    evidence = np.maximum(low_energy_ratio / SPEECH_LOW_ENERGY_RATIO, flatness_spread / SPEECH_FLATNESS_SPREAD)
+    speech_score = 1 / (1 + np.exp(-4 * (evidence - 1)))
+
+    labels = np.where(speech_score >= 0.5, LABELS.index('speech'), LABELS.index('music'))
+    labels[energy_db < SILENCE_DB] = LABELS.index('silence')
+    return energy_db, np.mean(flatness, axis=1), speech_score, labels.astype(np.int8)
+
+class SourceAnalyzer:
+    """Labels the source audio as silence, speech or music per interval.
+
+    The source is decoded as mono at ANALYSIS_RATE and analyzed block by
+    block, so memory stays constant; the features of a block are computed
+    for all of its frames at once with numpy.
+    """
+
+    def _open_decoder(self, path: Path, start: float, end: Optional[float]):
+        if Path(path).suffix.lower() == '.wav':
+            try:
+                reader = WavReader(path)
+            except (ValueError, EOFError):
+                pass
+            else:
+                reader.kill()
+                if reader.sample_rate % ANALYSIS_RATE == 0:
+                    start_frame = int(round(start * reader.sample_rate))
+                    end_frame = int(round(end * reader.sample_rate)) if end is not None else None
+                    return WavReader(path, start_frame, end_frame), reader.channels, reader.sample_rate // ANALYSIS_RATE
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+        if start > 0:
+            cmd.extend(['-ss', f"{start:.6f}"])
+        if end is not None:
+            cmd.extend(['-t', f"{end - start:.6f}"])
+        cmd.extend([
+            '-i', str(path), '-vn', '-map', '0:a:0',
+            '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(ANALYSIS_RATE), '-ac', '1',
+            'pipe:1'
+        ])
+        return tool_runner.start(cmd, stdout=subprocess.PIPE), 1, 1
+
+    def _iter_blocks(self, path: Path, start: float, end: Optional[float]) -> Iterator[np.ndarray]:
+        """Yield mono ANALYSIS_RATE blocks of BLOCK_INTERVALS intervals (the last one may be shorter)"""
+        decoder, channels, decimation = self._open_decoder(path, start, end)
+        block_bytes = BLOCK_INTERVALS * FRAME_SAMPLES * FRAMES_PER_INTERVAL * decimation * channels * 2
+        try:
+            while True:
+                data = decoder.stdout.read(block_bytes)
+                if not data:
+                    break
+                samples = np.frombuffer(data, dtype='<i2')
+                usable = len(samples) // (channels * decimation) * channels * decimation
+                # Downmix and decimate a WAV in the mix format; ffmpeg already delivers mono 16 kHz
+                mono = samples[:usable].reshape(-1, decimation * channels).astype(np.float32)
+                yield np.mean(mono, axis=1) / 32768.0
+            if decoder.wait() != 0:
+                raise RuntimeError(f"Could not decode audio from {path} for analysis:\n{decoder.stderr_tail}")
+        finally:
+            if decoder.poll() is None:
+                decoder.kill()
+                decoder.wait()
+
+    def analyze(self, path: Path, windows: Optional[Sequence[Tuple[float, float]]] = None,
+                progress: Optional[ProgressReporter] = None) -> SourceAnalysis:
+        """Analyze the whole source, or only the given (start, end) windows in seconds"""
+        start_time = time.time()
+        if progress is not None and windows:
+            progress.set_total(sum(end - start for start, end in windows), 'seconds')
+        parts: List[Tuple[int, Tuple[np.ndarray, ...]]] = []
+        for start, end in windows or [(0.0, None)]:
+            # Windows are widened to whole intervals so the labels line up with the timeline
+            first = int(start / INTERVAL_SECONDS)
+            last = int(np.ceil(end / INTERVAL_SECONDS)) if end is not None else None
+            offset = first
+            for block in self._iter_blocks(path, first * INTERVAL_SECONDS,
+                                           last * INTERVAL_SECONDS if last is not None else None):
+                # A trailing partial interval is padded with silence
+                padded = -len(block) % (FRAME_SAMPLES * FRAMES_PER_INTERVAL)
+                if padded:
+                    block = np.concatenate([block, np.zeros(padded, dtype=np.float32)])
+                features = analyze_intervals(block)
+                parts.append((offset, features))
+                offset += len(features[0])
+                if progress is not None:
+                    progress.advance(len(features[0]) * INTERVAL_SECONDS)
+
+        size = max([offset + len(features[0]) for offset, features in parts], default=0)
+        energy_db = np.full(size, -120.0)
+        flatness = np.zeros(size)
+        speech_score = np.zeros(size)
+        labels = np.zeros(size, dtype=np.int8)
+        for offset, (part_energy, part_flatness, part_score, part_labels) in parts:
+            end = offset + len(part_labels)
+            energy_db[offset:end] = part_energy
+            flatness[offset:end] = part_flatness
+            speech_score[offset:end] = part_score
+            labels[offset:end] = part_labels
+
+        analysis = SourceAnalysis(energy_db, flatness, speech_score, labels)
+        seconds = ", ".join(f"{name} {secs:.0f}s" for name, secs in analysis.summary().items())
+        print(f"Analyzed source audio in {time.time() - start_time:.2f} seconds: {seconds}")
+        return analysis
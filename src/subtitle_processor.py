@@ -13,6 +13,18 @@ class SubtitleEntry:
     text: str
 
 class SubtitleProcessor:
+    @staticmethod
+    def prepare_speech_text(text: str):
+        """Return (clean_text, is_lyrics) for a cue's text"""
+        # Check if it's lyrics (has HTML tags)
+        is_lyrics = '<i>' in text.lower() or '</i>' in text.lower()
+        
+        # Clean the text - only remove HTML tags and quotation marks
+        clean_text = re.sub(r'<[^>]*>', '', text)  # Remove HTML tags
+        clean_text = re.sub(r'["""„]', '', clean_text)  # Remove various quote marks
+        clean_text = clean_text.strip()  # Just trim whitespace
+        return clean_text, is_lyrics
+    
     def parse_srt(self, srt_path: str):
         """Parse SRT or ASS/SSA file with encoding detection"""
         # Detect if it's ASS/SSA format based on extension or content
@@ -0,0 +1,284 @@
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+@dataclass
+class ToolLimits:
+    timeout: Optional[float]  # seconds per call; None for no limit
+    concurrency: int  # calls running at the same time in one process
+
+# Defaults per tool; a call can pass its own timeout. The concurrency limit
+# applies to run(); piped tools from start() are bounded by their callers.
+TOOL_LIMITS: Dict[str, ToolLimits] = {
+    'ffmpeg': ToolLimits(timeout=4 * 3600, concurrency=max(4, multiprocessing.cpu_count())),
+    'ffprobe': ToolLimits(timeout=60, concurrency=2 * multiprocessing.cpu_count()),
+    'mkvmerge': ToolLimits(timeout=2 * 3600, concurrency=2),
+    'mkvextract': ToolLimits(timeout=3600, concurrency=2),
+}
+DEFAULT_LIMITS = ToolLimits(timeout=3600, concurrency=multiprocessing.cpu_count())
+
+# Only the end of a tool's stderr is kept; that is where the error is
+STDERR_TAIL_BYTES = 16 * 1024
+
+@dataclass
+class ToolUsage:
+    tool: str
+    command: str
+    returncode: Optional[int]
+    wall_seconds: float
+    cpu_seconds: Optional[float]  # None where os.wait4 is not available (Windows)
+    max_rss_bytes: Optional[int]
+    timed_out: bool = False
+
+class ToolError(subprocess.CalledProcessError):
+    """A tool exited with an error; str() includes the end of its stderr"""
+
+    def __str__(self):
+        message = super().__str__()
+        if self.stderr:
+            stderr = self.stderr if isinstance(self.stderr, str) else self.stderr.decode('utf-8', 'replace')
+            message += "\n" + "\n".join(stderr.strip().splitlines()[-10:])
+        return message
+
+class ToolTimeout(subprocess.TimeoutExpired):
+    """A tool was killed because it ran past its timeout"""
+
+_slots: Dict[str, threading.BoundedSemaphore] = {}
+_slots_lock = threading.Lock()
+# Forked pool workers must not inherit slots held by threads of the parent
+os.register_at_fork(after_in_child=_slots.clear)
+
+_usage_records: ContextVar[Optional[List[ToolUsage]]] = ContextVar('tool_usage_records', default=None)
+
+def tool_name(cmd: Sequence) -> str:
+    name = re.split(r'[\\/]', str(cmd[0]))[-1].lower()
+    return name[:-4] if name.endswith('.exe') else name
+
+def configure_tool(tool: str, timeout: Optional[float] = None, concurrency: Optional[int] = None):
+    """Change the limits of a tool (before its first call in this process)"""
+    limits = TOOL_LIMITS.setdefault(tool, ToolLimits(DEFAULT_LIMITS.timeout, DEFAULT_LIMITS.concurrency))
+    if timeout is not None:
+        limits.timeout = timeout
+    if concurrency is not None:
+        limits.concurrency = concurrency
+    with _slots_lock:
+        _slots.pop(tool, None)
+
+def _slot(tool: str) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        if tool not in _slots:
+            _slots[tool] = threading.BoundedSemaphore(TOOL_LIMITS.get(tool, DEFAULT_LIMITS).concurrency)
+        return _slots[tool]
+
+class ToolProcess:
+    """A running external tool, with a Popen-like interface.
+
+    With `limited`, the call waits for a free slot of its tool. The call is
+    killed when it runs past its timeout, and keeps the last STDERR_TAIL_BYTES of stderr. When it is
+    reaped its wall time, CPU time and peak RSS are added to the usage
+    records of the caller (see track_usage).
+    """
+
+    def __init__(self, cmd: Sequence, stdin=None, stdout=None, timeout: Optional[float] = None,
+                 limited: bool = True):
+        self.cmd = [str(arg) for arg in cmd]
+        self.tool = tool_name(self.cmd)
+        self.timeout = TOOL_LIMITS.get(self.tool, DEFAULT_LIMITS).timeout if timeout is None else timeout
+        self.returncode: Optional[int] = None
+        self.usage: Optional[ToolUsage] = None
+        self.timed_out = False
+        self._records = _usage_records.get()
+        self._lock = threading.Lock()
+        self._stderr = bytearray()
+
+        self._slot = _slot(self.tool) if limited else None
+        if self._slot is not None and not self._slot.acquire(timeout=self.timeout):
+            raise ToolTimeout(self.cmd, self.timeout)
+        try:
+            self._start = time.perf_counter()
+            self._popen = subprocess.Popen(self.cmd, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+        except BaseException:
+            if self._slot is not None:
+                self._slot.release()
+            raise
+        self.pid = self._popen.pid
+        self.stdin = self._popen.stdin
+        self.stdout = self._popen.stdout
+
+        self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+        self._timer = None
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _read_stderr(self):
+        while True:
+            data = self._popen.stderr.read1(65536)
+            if not data:
+                break
+            self._stderr += data
+            if len(self._stderr) > STDERR_TAIL_BYTES:
+                del self._stderr[:-STDERR_TAIL_BYTES]
+
+    def _expire(self):
+        with self._lock:
+            if self.returncode is None:
+                self.timed_out = True
+                self._popen.kill()
+
+    @property
+    def stderr_tail(self) -> str:
+        return bytes(self._stderr).decode('utf-8', 'replace')
+
+    def kill(self):
+        with self._lock:
+            if self.returncode is None:
+                self._popen.kill()
+
+    def poll(self) -> Optional[int]:
+        return self._reap(block=False)
+
+    def wait(self, check: bool = False) -> int:
+        """Wait for the tool to exit; with `check`, raise ToolTimeout or ToolError on failure"""
+        self._reap(block=True)
+        if check:
+            self.check()
+        return self.returncode
+
+    def check(self):
+        if self.timed_out:
+            raise ToolTimeout(self.cmd, self.timeout, stderr=self.stderr_tail)
+        if self.returncode:
+            raise ToolError(self.returncode, self.cmd, stderr=self.stderr_tail)
+
+    def _reap(self, block: bool) -> Optional[int]:
+        if self.returncode is not None:
+            return self.returncode
+        rusage = None
+        if hasattr(os, 'wait4'):
+            try:
+                pid, status, rusage = os.wait4(self.pid, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                # Reaped by Popen itself (e.g. from kill()); only the exit code is known
+                pid, status = self.pid, None
+            if pid == 0:
+                return None
+            returncode = os.waitstatus_to_exitcode(status) if status is not None else self._popen.wait()
+        else:
+            returncode = self._popen.wait() if block else self._popen.poll()
+            if returncode is None:
+                return None
+        with self._lock:
+            self.returncode = self._popen.returncode = returncode
+        self._finish(rusage)
+        return returncode
+
+    def _finish(self, rusage):
+        wall_seconds = time.perf_counter() - self._start
+        if self._timer is not None:
+            self._timer.cancel()
+        self._stderr_thread.join()
+        self._popen.stderr.close()
+        if self._slot is not None:
+            self._slot.release()
+
+        cpu_seconds = max_rss = None
+        if rusage is not None:
+            cpu_seconds = rusage.ru_utime + rusage.ru_stime
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS. It includes the
+            # forked interpreter before exec, so small tools show that as a floor.
+            max_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+        self.usage = ToolUsage(
+            tool=self.tool,
+            command=' '.join(self.cmd)[:200],
+            returncode=self.returncode,
+            wall_seconds=wall_seconds,
+            cpu_seconds=cpu_seconds,
+            max_rss_bytes=max_rss,
+            timed_out=self.timed_out
+        )
+        if self._records is not None:
+            self._records.append(self.usage)
+
+def start(cmd: Sequence, stdin=None, stdout=None, timeout: Optional[float] = None) -> ToolProcess:
+    """Start a tool with pipes (e.g. stdin=subprocess.PIPE for an encoder).
+
+    Piped tools take no slot: a stream lives as long as the job reading or
+    feeding it, and a decoder holding a slot while its job waits for encoder
+    slots deadlocks once every slot is held that way.
+    """
+    return ToolProcess(cmd, stdin=stdin, stdout=stdout, timeout=timeout, limited=False)
+
+def run(cmd: Sequence, timeout: Optional[float] = None, check: bool = True,
+        capture_output: bool = False, text: bool = False) -> subprocess.CompletedProcess:
+    """Run a tool to completion.
+
+    stdout is returned with `capture_output` and discarded otherwise; stderr
+    is always captured (its tail). Raises ToolTimeout on timeout and, with
+    `check`, ToolError on a non-zero exit code.
+    """
+    process = ToolProcess(cmd, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE if capture_output else subprocess.DEVNULL, timeout=timeout)
+    try:
+        stdout = process.stdout.read() if capture_output else None
+    finally:
+        if capture_output:
+            process.stdout.close()
+        process.wait()
+    if process.timed_out:
+        process.check()
+    stderr = process.stderr_tail
+    if text and stdout is not None:
+        stdout = stdout.decode('utf-8', 'replace')
+    if check and process.returncode:
+        raise ToolError(process.returncode, process.cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.cmd, process.returncode, stdout,
+                                       stderr if text else stderr.encode('utf-8'))
+
+@contextmanager
+def track_usage():
+    """Collect the usage of every tool started in this context (this thread or task)"""
+    records: List[ToolUsage] = []
+    token = _usage_records.set(records)
+    try:
+        yield records
+    finally:
+        _usage_records.reset(token)
+
+def add_usage(usage: List[ToolUsage]):
+    """Add usage collected elsewhere (e.g. in a pool process) to the current records"""
+    records = _usage_records.get()
+    if records is not None:
+        records.extend(usage)
+
+def call_tracked(fn: Callable, *args, **kwargs):
+    """Call fn and return (result, tool usage); used for tasks run in pool processes"""
+    with track_usage() as records:
+        result = fn(*args, **kwargs)
+    return result, records
+
+def summarize_usage(records: List[ToolUsage]) -> Dict[str, dict]:
+    """Per tool: calls, failures, timeouts, total wall and CPU seconds, peak RSS"""
+    summary = {}
+    for usage in records:
+        tool = summary.setdefault(usage.tool, {
+            'calls': 0, 'failures': 0, 'timeouts': 0,
+            'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'max_rss_bytes': 0
+        })
+        tool['calls'] += 1
+        tool['failures'] += 1 if usage.returncode else 0
+        tool['timeouts'] += 1 if usage.timed_out else 0
+        tool['wall_seconds'] += usage.wall_seconds
+        tool['cpu_seconds'] += usage.cpu_seconds or 0.0
+        tool['max_rss_bytes'] = max(tool['max_rss_bytes'], usage.max_rss_bytes or 0)
+    return summary
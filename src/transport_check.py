@@ -0,0 +1,74 @@
+"""Check of the pooled gTTS transport against the local TTS stand-in.
+
+Synthesizes short lines and lines long enough for gTTS to split into
+several tokens, which the transport fetches concurrently. Every line must
+come back as the stand-in's MP3 once per token, and all requests must run
+over at most `pool_size` keep-alive connections. A second pass with
+injected errors must still return every line through the retries.
+
+    python src/transport_check.py    # exit code 1 on failure
+"""
+import argparse
+import sys
+import time
+from typing import List
+
+from gtts import gTTS
+
+from tts_standin_server import StandInTTSServer
+from tts_transport import DEFAULT_POOL_SIZE, PooledTransport
+
+SHORT_LINE = "Tere tulemast tagasi."
+# Over gTTS's 100-character token limit, so each is several requests
+LONG_LINE = ("See on pikk lause, mille gTTS jagab mitmeks osaks, sest iga päring võib sisaldada "
+             "ainult sada märki. Osad tuuakse paralleelselt ja liidetakse õiges järjekorras kokku, "
+             "nii et kuuldav tulemus on üks katkematu lõik.")
+
+def run_pass(lines: List[str], pool_size: int, error_rate: float = 0.0, retries: int = 2) -> List[str]:
+    failures = []
+    with StandInTTSServer(latency=0.01, error_rate=error_rate, seed=1) as server:
+        transport = PooledTransport(endpoint=server.url, pool_size=pool_size, retries=retries)
+        try:
+            tokens = 0
+            for index, text in enumerate(lines):
+                tts = gTTS(text=text, lang='et')
+                line_tokens = len(tts._prepare_requests())
+                tokens += line_tokens
+                data = transport.synthesize(tts)
+                if data != server.mp3_bytes * line_tokens:
+                    failures.append(f"line {index}: {len(data)} bytes, expected {line_tokens} x "
+                                    f"{len(server.mp3_bytes)} bytes of the stand-in's MP3")
+        finally:
+            transport.close()
+        print(f"  {len(lines)} lines, {tokens} tokens: {server.request_count} requests "
+              f"({server.error_count} failed) over {server.connection_count} connections")
+        if server.request_count != tokens + server.error_count:
+            failures.append(f"{server.request_count} requests for {tokens} tokens and {server.error_count} errors")
+        # An error reply is followed by a retry on the same connection, so errors must not add connections
+        if server.connection_count > pool_size:
+            failures.append(f"{server.connection_count} connections for a pool of {pool_size}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the pooled gTTS transport against the local stand-in')
+    parser.add_argument('--lines', type=int, default=40, help='Short lines per pass (default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help='(default: %(default)s)')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    lines = [SHORT_LINE] * args.lines + [LONG_LINE] * (args.lines // 4)
+    print("Pooled transport:")
+    failures = run_pass(lines, args.pool_size)
+    print("Pooled transport with injected errors:")
+    failures += [f"with errors: {failure}" for failure in run_pass(lines, args.pool_size, error_rate=0.1, retries=5)]
+
+    print(f"Checked in {time.perf_counter() - start_time:.2f} seconds")
+    if failures:
+        print("Transport check FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("Transport check passed")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,66 @@
+from dataclasses import dataclass
 from pathlib import Path
-import tempfile
 from gtts import gTTS
-import subprocess
 import time
 import os
 import uuid
+import hashlib
+import shutil
+from typing import Optional
+from clip_conditioner import ClipConditioner
+from subtitle_processor import SubtitleProcessor
+from workspace import Workspace
+from tts_transport import PooledTransport
+import tool_runner
+
+# Workspace size estimate for a generated clip: about five seconds of 48 kHz stereo PCM
+CLIP_SIZE_HINT = 1024 * 1024
+
+@dataclass
+class SpeechClip:
+    start_time: float  # cue start in seconds
+    end_time: float    # cue end in seconds
+    path: Path
+    is_lyrics: bool = False
+    # Filled in by the clip conditioning stage
+    duration: Optional[float] = None  # seconds of speech after trimming
 
 class TTSEngine:
-    def __init__(self, language: str = 'et'):
-        self.temp_dir = Path(tempfile.mkdtemp())
+    def __init__(self, language: str = 'et', workspace: Optional[Workspace] = None,
+                 transport: Optional[PooledTransport] = None, cache_dir: Optional[str] = None):
+        self.workspace = workspace or Workspace()
+        self._owns_workspace = workspace is None
         self.language = language
+        # Shared keep-alive connections for all gTTS requests of this process
+        self.transport = transport or PooledTransport()
+        # Optional directory of finished clips that outlives the workspace (used by the server)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
         
     def generate_speech(self, text: str, speed: float = 1.0) -> Path:
         """Generate speech with a unique filename to avoid conflicts in parallel processing"""
+        cached_path = None
+        if self.cache_dir is not None:
+            key = hashlib.sha1(f"{self.language}|{speed}|{text}".encode('utf-8')).hexdigest()
+            cached_path = self.cache_dir / f"{key}.wav"
+            if cached_path.exists():
+                # Refresh the modification time so cache pruning keeps recently used clips
+                os.utime(cached_path)
+                return cached_path
+        
         print(f"Generating speech for: '{text}' with speed={speed}")
         start_time = time.time()
         
         # Use UUID to ensure unique filenames across processes
         unique_id = uuid.uuid4()
-        mp3_path = self.temp_dir / f"{unique_id}.mp3"
-        wav_path = self.temp_dir / f"{unique_id}.wav"
+        mp3_path = self.workspace.path(f"{unique_id}.mp3", size_hint=CLIP_SIZE_HINT // 10)
+        wav_path = self.workspace.path(f"{unique_id}.wav", size_hint=CLIP_SIZE_HINT)
         
         try:
             # Generate MP3
             tts = gTTS(text=text, lang=self.language, slow=False)
-            tts.save(str(mp3_path))
+            self.transport.save(tts, mp3_path)
             print(f"MP3 generation took {time.time() - start_time:.2f} seconds")
             
             # Convert to WAV with speed adjustment
@@ -40,22 +76,44 @@ class TTSEngine:
             ]
             
             ffmpeg_start = time.time()
-            subprocess.run(cmd, capture_output=True, check=True, timeout=30)
+            tool_runner.run(cmd, timeout=30)
             print(f"FFmpeg conversion took {time.time() - ffmpeg_start:.2f} seconds")
             
             if wav_path.stat().st_size < 1000:
                 raise RuntimeError("Generated WAV file is too small")
             
-            mp3_path.unlink()
+            self.workspace.release(mp3_path)
+            
+            if cached_path is not None:
+                # Move the clip into the cache; the workspace never deletes cached clips
+                temp_cached = cached_path.with_suffix(f".{unique_id}.tmp")
+                shutil.move(str(wav_path), str(temp_cached))
+                os.replace(temp_cached, cached_path)
+                self.workspace.release(wav_path)
+                return cached_path
             return wav_path
             
         except Exception as e:
-            if mp3_path.exists():
-                mp3_path.unlink()
-            if wav_path.exists():
-                wav_path.unlink()
+            self.workspace.release(mp3_path)
+            self.workspace.release(wav_path)
             raise e
     
     def cleanup(self):
-        import shutil
-        shutil.rmtree(self.temp_dir) 
\ No newline at end of file
+        self.transport.close()
+        if self._owns_workspace:
+            self.workspace.cleanup() 
+
+def synthesize_cue(engine: TTSEngine, conditioner: ClipConditioner, text: str,
+                   start_time: float, end_time: float, speed: float = 1.0) -> SpeechClip:
+    """Speak one subtitle cue: clean its text, generate speech and condition the clip"""
+    clean_text, is_lyrics = SubtitleProcessor.prepare_speech_text(text)
+    tts_audio = engine.generate_speech(clean_text, speed=speed)
+    # Trim silence and normalize loudness before the clip reaches the mixer
+    tts_audio, conditioning = conditioner.condition(tts_audio, engine.workspace)
+    return SpeechClip(
+        start_time=start_time,
+        end_time=end_time,
+        path=tts_audio,
+        is_lyrics=is_lyrics,
+        duration=conditioning.duration
+    )
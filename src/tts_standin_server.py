@@ -0,0 +1,126 @@
+import base64
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono. An all-zero side info decodes as silence.
+_SILENT_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+_SILENT_FRAME_SIZE = 417
+_SILENT_FRAME_SECONDS = 1152 / 44100
+
+def silent_mp3(seconds: float) -> bytes:
+    """Build a valid MP3 stream of silence lasting roughly `seconds`"""
+    frames = max(1, int(seconds / _SILENT_FRAME_SECONDS))
+    frame = _SILENT_FRAME_HEADER + bytes(_SILENT_FRAME_SIZE - len(_SILENT_FRAME_HEADER))
+    return frame * frames
+
+class StandInTTSServer:
+    """Local HTTP server that answers gTTS batchexecute requests with a canned MP3.
+
+    Latency and error rate can be injected so tests and benchmarks exercise the
+    transport without reaching Google.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, mp3_bytes: Optional[bytes] = None,
+                 latency: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.mp3_bytes = mp3_bytes if mp3_bytes is not None else silent_mp3(1.0)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.error_count = 0
+        self.connection_count = 0  # TCP connections accepted; fewer than requests when clients keep them alive
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connection_count += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        with self._lock:
+            self.request_count += 1
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            body = b'stand-in server error'
+            handler.send_response(503)
+        else:
+            payload = base64.b64encode(self.mp3_bytes).decode('ascii')
+            body = (")]}'\n\n"
+                    f'[["wrb.fr","jQ1olc","[\\"{payload}\\"]",null,null,null,"generic"]]\n').encode('utf-8')
+            handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self) -> 'StandInTTSServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Local stand-in for the gTTS endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--mp3', help='MP3 file to return (default: one second of silence)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each reply')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 503')
+    parser.add_argument('--seed', type=int, help='Seed for the injected errors')
+    args = parser.parse_args()
+
+    mp3_bytes = Path(args.mp3).read_bytes() if args.mp3 else None
+    server = StandInTTSServer(args.host, args.port, mp3_bytes, args.latency, args.error_rate, args.seed)
+    print(f"Stand-in TTS server listening on {server.url}")
+    print(f"Use --tts-endpoint {server.url} (or DUBDUB_TTS_ENDPOINT) to send TTS requests here")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
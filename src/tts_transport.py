@@ -0,0 +1,134 @@
+import base64
+import os
+import re
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from gtts import __version__ as gtts_version, gTTS
+from gtts.tts import gTTSError
+
+# Same pattern gTTS uses to pull the base64 audio out of a batchexecute reply
+AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+DEFAULT_POOL_SIZE = 8
+
+# Sessions are kept per process and per settings, so transports unpickled in
+# long-lived worker processes keep reusing warm connections between tasks
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+class PooledTransport:
+    """Sends gTTS token requests over a keep-alive connection pool.
+
+    gTTS opens a fresh session (and TLS handshake) for every token of every
+    line. This transport keeps one session per process and fetches the tokens
+    of a line concurrently. Set `endpoint` (or DUBDUB_TTS_ENDPOINT) to point
+    the requests at another host, e.g. the local stand-in server.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = 30.0, retries: int = 2):
+        self.endpoint = endpoint or os.environ.get('DUBDUB_TTS_ENDPOINT')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+        self._executor = None
+
+    def __getstate__(self):
+        # Sessions and threads belong to the process that created them
+        state = self.__dict__.copy()
+        state['_session'] = None
+        state['_executor'] = None
+        return state
+
+    def _ensure_session(self) -> requests.Session:
+        key = (os.getpid(), self.endpoint, self.pool_size, self.timeout, self.retries)
+        with _SESSIONS_LOCK:
+            if key not in _SESSIONS:
+                session = requests.Session()
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=0.2,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(['POST']),
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                # gTTS disables verification to work behind intercepting proxies
+                session.verify = False
+                session.proxies.update(urllib.request.getproxies())
+                try:
+                    requests.packages.urllib3.disable_warnings(
+                        requests.packages.urllib3.exceptions.InsecureRequestWarning
+                    )
+                except Exception:
+                    pass
+                _SESSIONS[key] = (session, ThreadPoolExecutor(max_workers=self.pool_size))
+            self._session, self._executor = _SESSIONS[key]
+            return self._session
+
+    def _rewrite_url(self, url: str) -> str:
+        if not self.endpoint:
+            return url
+        target = urllib.parse.urlsplit(self.endpoint)
+        original = urllib.parse.urlsplit(url)
+        return urllib.parse.urlunsplit((target.scheme, target.netloc, original.path, original.query, ''))
+
+    def _fetch(self, tts: gTTS, prepared) -> bytes:
+        prepared.url = self._rewrite_url(prepared.url)
+        try:
+            response = self._session.send(prepared, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            raise gTTSError(tts=tts, response=response)
+        except requests.exceptions.RequestException:
+            raise gTTSError(tts=tts)
+
+        audio = []
+        for line in response.text.splitlines():
+            if 'jQ1olc' in line:
+                match = AUDIO_PATTERN.search(line)
+                if not match:
+                    raise gTTSError(tts=tts, response=response)
+                audio.append(base64.b64decode(match.group(1).encode('ascii')))
+        return b''.join(audio)
+
+    def synthesize(self, tts: gTTS) -> bytes:
+        """Fetch all tokens of a gTTS request and return the joined MP3 bytes"""
+        self._ensure_session()
+        if not hasattr(tts, '_prepare_requests'):
+            # The token requests are gTTS internals (see the pin in requirements.txt)
+            raise RuntimeError(f"gTTS {gtts_version} has no _prepare_requests(); install the version "
+                               f"pinned in requirements.txt")
+        prepared_requests = tts._prepare_requests()
+        if len(prepared_requests) == 1:
+            return self._fetch(tts, prepared_requests[0])
+        # Tokens are independent requests; fetch them concurrently, keep their order
+        parts: List[bytes] = list(self._executor.map(lambda pr: self._fetch(tts, pr), prepared_requests))
+        return b''.join(parts)
+
+    def save(self, tts: gTTS, path) -> None:
+        data = self.synthesize(tts)
+        with open(str(path), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        """Drop this process's pooled connections for these settings"""
+        key = (os.getpid(), self.endpoint, self.pool_size, self.timeout, self.retries)
+        with _SESSIONS_LOCK:
+            entry = _SESSIONS.pop(key, None)
+        if entry is not None:
+            session, executor = entry
+            executor.shutdown(wait=False)
+            session.close()
+        self._session = None
+        self._executor = None
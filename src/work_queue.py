@@ -0,0 +1,232 @@
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+@dataclass
+class Shard:
+    job_id: str
+    shard_id: str
+    language: str
+    speed: float
+    lines: List[dict]  # SubtitleEntry fields plus 'index'
+    attempt: int = 0
+    error: Optional[str] = None
+    # Lease of the worker holding the shard; it heartbeats at a third of this
+    lease_seconds: Optional[float] = None
+    # Set on every claim; a worker whose lease expired no longer matches it
+    lease_id: Optional[str] = None
+
+@dataclass
+class ShardResult:
+    shard_id: str
+    worker: str
+    clips: List[dict] = field(default_factory=list)  # SpeechClip fields
+    failed_lines: List[int] = field(default_factory=list)
+
+class WorkQueue(ABC):
+    """Interface between the coordinator and synthesis workers.
+
+    A shard is claimed under a lease. Workers renew the lease while they work;
+    a shard whose lease expires (worker crashed or lost) is re-issued to
+    another worker. renew(), complete() and fail() do nothing for a worker
+    whose lease has passed to another one; renew() returns False then. Clip
+    artifacts are written to artifact_dir(), which must be readable by the
+    coordinator.
+    """
+
+    @abstractmethod
+    def submit(self, shards: List[Shard]) -> None:
+        ...
+
+    @abstractmethod
+    def claim(self, worker: str) -> Optional[Shard]:
+        ...
+
+    @abstractmethod
+    def renew(self, shard: Shard) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, shard: Shard, result: ShardResult) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, shard: Shard, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def results(self, job_id: str) -> Dict[str, ShardResult]:
+        ...
+
+    @abstractmethod
+    def failed(self, job_id: str) -> Dict[str, Shard]:
+        ...
+
+    @abstractmethod
+    def requeue_expired(self, job_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def artifact_dir(self, job_id: str) -> Path:
+        ...
+
+    @abstractmethod
+    def close_job(self, job_id: str) -> None:
+        ...
+
+class DirectoryWorkQueue(WorkQueue):
+    """Work queue on a shared directory (local disk or a network share).
+
+    Each job gets jobs/<job_id>/{pending,claimed,done,failed,clips}. Claiming
+    is an atomic rename from pending/ to claimed/; the claimed file's mtime is
+    the lease heartbeat. No external service is required, so any number of
+    local or remote worker processes can run against the same directory.
+    """
+
+    def __init__(self, root: str, lease_seconds: float = 120.0, max_attempts: int = 3):
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        (self.root / 'jobs').mkdir(parents=True, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.root / 'jobs' / job_id
+
+    def _write_json(self, path: Path, payload: dict) -> None:
+        # Write then rename so readers never see a partial file
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        temp_path.write_text(json.dumps(payload), encoding='utf-8')
+        os.replace(temp_path, path)
+
+    def _read_shard(self, path: Path) -> Shard:
+        return Shard(**json.loads(path.read_text(encoding='utf-8')))
+
+    def submit(self, shards: List[Shard]) -> None:
+        for shard in shards:
+            job_dir = self._job_dir(shard.job_id)
+            for name in ('pending', 'claimed', 'done', 'failed', 'clips'):
+                (job_dir / name).mkdir(parents=True, exist_ok=True)
+            self._write_json(job_dir / 'pending' / f"{shard.shard_id}.json", shard.__dict__)
+
+    def claim(self, worker: str) -> Optional[Shard]:
+        for job_dir in sorted((self.root / 'jobs').iterdir()):
+            pending_dir = job_dir / 'pending'
+            if not pending_dir.is_dir():
+                continue
+            for pending in sorted(pending_dir.glob('*.json')):
+                claimed = job_dir / 'claimed' / pending.name
+                try:
+                    os.rename(pending, claimed)
+                except (FileNotFoundError, PermissionError):
+                    continue  # another worker was faster
+                os.utime(claimed)
+                # Record this worker's lease, so the coordinator expires the shard against it
+                shard = self._read_shard(claimed)
+                shard.lease_seconds = self.lease_seconds
+                shard.lease_id = uuid.uuid4().hex
+                self._write_json(claimed, shard.__dict__)
+                return shard
+        return None
+
+    def _holds(self, claimed: Path, shard: Shard) -> bool:
+        try:
+            return self._read_shard(claimed).lease_id == shard.lease_id
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def renew(self, shard: Shard) -> bool:
+        claimed = self._job_dir(shard.job_id) / 'claimed' / f"{shard.shard_id}.json"
+        if not self._holds(claimed, shard):
+            return False
+        try:
+            os.utime(claimed)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _take_claim(self, shard: Shard) -> Optional[Path]:
+        """Move the claim of `shard` aside if it is still under this lease.
+
+        The rename makes sure only one of a lost worker and the new holder (or
+        the coordinator expiring it) finishes the shard. Returns the moved
+        file, which the caller deletes once the shard is recorded.
+        """
+        claimed = self._job_dir(shard.job_id) / 'claimed' / f"{shard.shard_id}.json"
+        taken = claimed.with_name(f".{claimed.name}.{uuid.uuid4().hex[:8]}.taken")
+        try:
+            os.rename(claimed, taken)
+        except FileNotFoundError:
+            return None
+        if not self._holds(taken, shard):
+            os.rename(taken, claimed)  # claimed again by another worker meanwhile
+            return None
+        return taken
+
+    def complete(self, shard: Shard, result: ShardResult) -> None:
+        job_dir = self._job_dir(shard.job_id)
+        if not job_dir.exists():
+            return  # job was closed by the coordinator
+        taken = self._take_claim(shard)
+        if taken is None:
+            print(f"Shard {shard.shard_id} was re-issued after its lease expired; dropping this result")
+            return
+        self._write_json(job_dir / 'done' / f"{shard.shard_id}.json", result.__dict__)
+        taken.unlink()
+
+    def fail(self, shard: Shard, error: str) -> None:
+        job_dir = self._job_dir(shard.job_id)
+        if not job_dir.exists():
+            return
+        taken = self._take_claim(shard)
+        if taken is None:
+            return  # the lease already passed to another worker
+        shard.attempt += 1
+        shard.error = error
+        shard.lease_id = None
+        target = 'pending' if shard.attempt < self.max_attempts else 'failed'
+        self._write_json(job_dir / target / f"{shard.shard_id}.json", shard.__dict__)
+        taken.unlink()
+
+    def results(self, job_id: str) -> Dict[str, ShardResult]:
+        results = {}
+        for path in (self._job_dir(job_id) / 'done').glob('*.json'):
+            results[path.stem] = ShardResult(**json.loads(path.read_text(encoding='utf-8')))
+        return results
+
+    def failed(self, job_id: str) -> Dict[str, Shard]:
+        return {path.stem: self._read_shard(path) for path in (self._job_dir(job_id) / 'failed').glob('*.json')}
+
+    def requeue_expired(self, job_id: str) -> int:
+        """Re-issue shards whose worker stopped renewing its lease"""
+        job_dir = self._job_dir(job_id)
+        requeued = 0
+        now = time.time()
+        for claimed in (job_dir / 'claimed').glob('*.json'):
+            try:
+                shard = self._read_shard(claimed)
+                if now - claimed.stat().st_mtime < (shard.lease_seconds or self.lease_seconds):
+                    continue
+            except (FileNotFoundError, ValueError):
+                continue  # completed meanwhile, or being rewritten
+            if (job_dir / 'done' / claimed.name).exists():
+                continue
+            print(f"Shard {shard.shard_id} lease expired, re-issuing")
+            self.fail(shard, 'lease expired')
+            requeued += 1
+        return requeued
+
+    def artifact_dir(self, job_id: str) -> Path:
+        return self._job_dir(job_id) / 'clips'
+
+    def close_job(self, job_id: str) -> None:
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
@@ -0,0 +1,193 @@
+from pathlib import Path
+import tempfile
+import threading
+import shutil
+import os
+import time
+from typing import Dict, Optional
+
+# RAM-backed filesystem used for intermediates when it is available
+MEMORY_BASE = Path('/dev/shm')
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+# How often path() rescans the memory directory for files of other processes
+MEMORY_SCAN_SECONDS = 1.0
+
+class Workspace:
+    """Scratch space shared by every stage of one dubbing job.
+
+    Intermediates are placed in /dev/shm while they fit into the memory budget
+    and spill to a short-named directory on disk otherwise. The budget is
+    checked against this process's own artifacts plus what other worker
+    processes sharing the workspace had written at the last rescan of the
+    memory directory (at most MEMORY_SCAN_SECONDS old). Every artifact is
+    registered with the number of consumers that still need it and is deleted
+    as soon as the last one calls release().
+    """
+
+    def __init__(self, prefer_memory: bool = True, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 base_dir: Optional[str] = None):
+        # Short, unique directory names avoid Windows path length limitations
+        # and collisions between instances created at the same moment
+        disk_base = base_dir or os.environ.get('TEMP', tempfile.gettempdir())
+        self.disk_dir = Path(tempfile.mkdtemp(prefix='dd', dir=disk_base))
+
+        self.memory_dir = None
+        self.memory_budget = 0
+        if prefer_memory and MEMORY_BASE.is_dir() and os.access(MEMORY_BASE, os.W_OK):
+            try:
+                self.memory_dir = Path(tempfile.mkdtemp(prefix='dd', dir=str(MEMORY_BASE)))
+                self.memory_budget = min(memory_budget, shutil.disk_usage(MEMORY_BASE).free // 2)
+            except OSError as e:
+                print(f"Note: Could not use {MEMORY_BASE} for intermediates: {e}")
+                self.memory_dir = None
+
+        self._artifacts: Dict[str, dict] = {}
+        self._memory_bytes = 0
+        self._memory_reserved = 0  # size hints of memory artifacts not committed yet
+        self._memory_others = 0  # bytes of other processes at the last rescan
+        self._scanned_at = None
+        self._disk_bytes = 0
+        self.peak_memory_bytes = 0
+        self.peak_disk_bytes = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Workspaces are handed to worker processes; locks cannot be pickled
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        # A new process starts with no artifacts of its own; what the parent had is on disk
+        self._artifacts = {}
+        self._memory_bytes = self._memory_reserved = self._disk_bytes = 0
+        self._scanned_at = None
+
+    @property
+    def root(self) -> Path:
+        """Preferred directory for new artifacts"""
+        return self.memory_dir or self.disk_dir
+
+    def path(self, name: str, consumers: int = 1, size_hint: int = 0) -> Path:
+        """Reserve a path for a new artifact that `consumers` stages will read.
+
+        `size_hint` is the expected size in bytes; the artifact goes to memory
+        only if it fits next to what is already there.
+        """
+        with self._lock:
+            path = self.disk_dir / name
+            if self.memory_dir is not None:
+                in_use = self._memory_bytes + self._memory_reserved + self._other_memory_bytes()
+                if in_use + size_hint <= self.memory_budget:
+                    path = self.memory_dir / name
+                    self._memory_reserved += size_hint
+            self._artifacts[str(path)] = {'consumers': consumers, 'size': 0, 'hint': size_hint, 'committed': False}
+        return path
+
+    def _other_memory_bytes(self) -> int:
+        """Bytes other processes had in the memory directory at the last rescan"""
+        now = time.monotonic()
+        if self._scanned_at is None or now - self._scanned_at >= MEMORY_SCAN_SECONDS:
+            self._memory_others = max(0, self._scan_memory_dir() - self._memory_bytes)
+            self._scanned_at = now
+        return self._memory_others
+
+    def _scan_memory_dir(self) -> int:
+        """Bytes in the memory directory now, written by any process sharing this workspace"""
+        total = 0
+        try:
+            with os.scandir(self.memory_dir) as entries:
+                for entry in entries:
+                    try:
+                        total += entry.stat(follow_symlinks=False).st_size
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return total
+
+    def commit(self, path: Path) -> None:
+        """Account for the size of an artifact once it has been written"""
+        key = str(path)
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is None:
+                return
+            try:
+                size = os.path.getsize(key)
+            except OSError:
+                size = 0
+            self._account(key, size - artifact['size'])
+            self._unreserve(key, artifact)
+            artifact['size'] = size
+            artifact['committed'] = True
+
+    def adopt(self, path: Path, consumers: int = 1) -> None:
+        """Take ownership of an artifact written by another process into this workspace"""
+        if not self.owns(path):
+            return
+        with self._lock:
+            if str(path) not in self._artifacts:
+                self._artifacts[str(path)] = {'consumers': consumers, 'size': 0, 'hint': 0, 'committed': False}
+        self.commit(path)
+
+    def owns(self, path: Path) -> bool:
+        parent = Path(path).parent
+        return parent == self.disk_dir or (self.memory_dir is not None and parent == self.memory_dir)
+
+    def release(self, path: Optional[Path]) -> None:
+        """Mark one consumer of an artifact as finished, deleting it after the last one"""
+        if path is None:
+            return
+        key = str(path)
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is None:
+                return
+            artifact['consumers'] -= 1
+            if artifact['consumers'] > 0:
+                return
+            del self._artifacts[key]
+            self._account(key, -artifact['size'])
+            self._unreserve(key, artifact)
+        try:
+            Path(key).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not delete intermediate {key}: {e}")
+
+    def _account(self, key: str, delta: int) -> None:
+        if self.memory_dir is not None and key.startswith(str(self.memory_dir)):
+            self._memory_bytes += delta
+            self.peak_memory_bytes = max(self.peak_memory_bytes, self._memory_bytes)
+        else:
+            self._disk_bytes += delta
+            self.peak_disk_bytes = max(self.peak_disk_bytes, self._disk_bytes)
+
+    def _unreserve(self, key: str, artifact: dict) -> None:
+        if not artifact['committed'] and self.memory_dir is not None and key.startswith(str(self.memory_dir)):
+            self._memory_reserved -= artifact['hint']
+
+    def usage_summary(self) -> str:
+        mb = 1024 * 1024
+        summary = f"peak disk use {self.peak_disk_bytes / mb:.1f} MB"
+        if self.memory_dir is not None:
+            summary += f", peak memory use {self.peak_memory_bytes / mb:.1f} MB in {self.memory_dir}"
+        return summary
+
+    def cleanup(self):
+        """Remove the workspace and everything still in it"""
+        for directory in (self.memory_dir, self.disk_dir):
+            if directory is None:
+                continue
+            try:
+                shutil.rmtree(directory)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning: Could not clean up temp dir {directory}: {e}")
+        self._artifacts.clear()
+        self._memory_reserved = 0